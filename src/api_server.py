@@ -0,0 +1,420 @@
+"""HTTP and server-sent events API around the GovSeek retrieval pipeline.
+
+Endpoints:
+    POST /chat: {"message": ..., "thread_id": ...} returns the answer and sources as JSON
+        (the conversation history is only kept when a thread_id is given)
+    POST /chat/stream: same body, streams the answer as server-sent events
+    GET /health: liveness check
+    GET /metrics: metrics in the Prometheus text format when metrics are enabled
+
+Query embeddings and Qdrant searches of concurrent requests are micro-batched, and
+requests beyond the concurrency limit wait in a bounded queue. Requests that do not
+fit in the queue are rejected with 503 so the server sheds load instead of piling up.
+
+The server is configured through environment variables:
+    API_MAX_CONCURRENCY: chat turns processed at the same time (default 32)
+    API_MAX_QUEUE: chat turns waiting for a slot before rejecting (default 128)
+    API_BATCH_WAIT_MS: time a query waits for others to batch with (default 5)
+    API_MAX_THREADS: conversation threads kept in memory (default 10000)
+
+Usage:
+    uv run src/api_server.py [--port 8000] [--fake]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, Tuple
+from uuid import uuid4
+
+import anyio
+import uvicorn
+from dotenv import load_dotenv
+from loguru import logger
+from qdrant_client import QdrantClient
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.types import Receive, Scope, Send
+
+from data_pipeline.embedding_storage import get_embedding_dimensions, get_embeddings
+from data_pipeline.vector_store import VectorStore
+from monitoring.metrics import get_metrics, increment, span
+from retrieval_pipeline.batching import BatchedEmbeddings, BatchedQdrantSearch
+from retrieval_pipeline.fake_models import FakeChatModel, FakeEmbeddings
+from retrieval_pipeline.retriever import RetrievalPipeline
+
+load_dotenv()
+
+
+class Overloaded(Exception):
+    """Raised when the request queue of the server is full."""
+
+
+class ConcurrencyLimiter:
+    """Limit the chat turns in flight and the number of requests waiting for a slot."""
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        """Initialize the limiter.
+
+        Args:
+            max_concurrency: Chat turns processed at the same time
+            max_queue: Requests waiting for a slot before new ones are rejected
+        """
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.waiting = 0
+
+    async def acquire(self) -> None:
+        """Wait for a slot, or raise Overloaded if the queue is full."""
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            increment("api_rejected")
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        """Free a slot."""
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ThreadStore:
+    """Keep the checkpoints of the most recently used conversation threads only."""
+
+    def __init__(self, pipeline: RetrievalPipeline, max_threads: int):
+        """Initialize the store.
+
+        Args:
+            pipeline: Retrieval pipeline whose checkpointer holds the threads
+            max_threads: Threads kept before the least recently used one is deleted
+        """
+        self.pipeline = pipeline
+        self.max_threads = max_threads
+        self.threads: "OrderedDict[str, None]" = OrderedDict()
+
+    def touch(self, thread_id: str) -> None:
+        """Mark a thread as used, deleting the least recently used beyond the limit.
+
+        Args:
+            thread_id: Conversation thread
+        """
+        self.threads[thread_id] = None
+        self.threads.move_to_end(thread_id)
+        while len(self.threads) > self.max_threads:
+            oldest, _ = self.threads.popitem(last=False)
+            self.forget(oldest)
+            increment("api_threads_evicted")
+
+    def forget(self, thread_id: str) -> None:
+        """Delete the checkpoints of a thread.
+
+        Args:
+            thread_id: Conversation thread
+        """
+        self.threads.pop(thread_id, None)
+        self.pipeline.memory.delete_thread(thread_id)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """Streaming response that runs a callback once it is sent or aborted.
+
+    Unlike a background task, the callback also runs when the client disconnects
+    before or during the stream.
+    """
+
+    def __init__(
+        self, content: AsyncIterator[str], on_close: Callable[[], None], **kwargs
+    ):
+        """Initialize the response.
+
+        Args:
+            content: Async generator of the response body
+            on_close: Called once the response is finished
+            kwargs: Arguments passed to StreamingResponse
+        """
+        super().__init__(content, **kwargs)
+        self.content = content
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Send the response, then close the body and run the callback."""
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.content.aclose()
+            finally:
+                self.on_close()
+
+
+def format_event(event: str, data) -> str:
+    """Format a server-sent event.
+
+    Args:
+        event: Name of the event
+        data: JSON-serialisable payload
+
+    Returns:
+        Event in the text/event-stream format
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def build_fake_corpus(client: QdrantClient, embeddings: FakeEmbeddings, size: int):
+    """Fill an in-memory collection with synthetic documents for load testing.
+
+    Args:
+        client: In-memory Qdrant client
+        embeddings: Fake embeddings model
+        size: Number of documents
+    """
+    topics = ["income tax", "CPF savings", "HDB flats", "passports", "healthcare"]
+    texts = [
+        f"Document {i} explains {topics[i % len(topics)]} for Singapore residents."
+        for i in range(size)
+    ]
+    metadatas = [
+        {"source": f"https://www.example.gov.sg/page-{i}"} for i in range(size)
+    ]
+    VectorStore(client=client, embeddings=embeddings).vector_store.add_texts(
+        texts, metadatas=metadatas
+    )
+
+
+def build_pipeline(
+    fake: bool = False,
+    batching: bool = True,
+    batch_wait_ms: float = 5.0,
+    fake_embedding_latency_ms: float = 100.0,
+    fake_llm_latency_ms: float = 100.0,
+    fake_embedding_concurrency: Optional[int] = 2,
+    fake_corpus_size: int = 1000,
+) -> RetrievalPipeline:
+    """Build the retrieval pipeline served by the API.
+
+    Args:
+        fake: Use fake models and an in-memory collection instead of OpenAI and Qdrant
+        batching: Micro-batch query embeddings and Qdrant searches
+        batch_wait_ms: Time a query waits for others to batch with
+        fake_embedding_latency_ms: Latency of each fake embeddings request
+        fake_llm_latency_ms: Latency of each fake chat model call
+        fake_embedding_concurrency: Fake embeddings requests allowed at the same time
+        fake_corpus_size: Number of synthetic documents in fake mode
+
+    Returns:
+        Retrieval pipeline
+    """
+    llm = None
+    if fake:
+        client = QdrantClient(":memory:")
+        embeddings = FakeEmbeddings(
+            size=get_embedding_dimensions(),
+            latency=fake_embedding_latency_ms / 1000,
+            max_concurrent_calls=fake_embedding_concurrency,
+        )
+        build_fake_corpus(client, embeddings, fake_corpus_size)
+        llm = FakeChatModel(latency=fake_llm_latency_ms / 1000)
+    else:
+        if not os.environ.get("QDRANT_URL"):
+            raise ValueError("QDRANT_URL environment variable is not set")
+        client = QdrantClient(
+            url=os.environ.get("QDRANT_URL"), api_key=os.environ.get("QDRANT_API_KEY")
+        )
+        embeddings = get_embeddings()
+
+    search = None
+    if batching:
+        embeddings = BatchedEmbeddings(embeddings, max_wait_ms=batch_wait_ms)
+        search = BatchedQdrantSearch(
+            client, "demo_collection", max_wait_ms=batch_wait_ms
+        )
+
+    return RetrievalPipeline(
+        llm=llm, embeddings=embeddings, client=client, search=search
+    )
+
+
+def create_app(
+    pipeline: RetrievalPipeline,
+    max_concurrency: int = 32,
+    max_queue: int = 128,
+    max_threads: int = 10000,
+) -> Starlette:
+    """Create the ASGI application.
+
+    Args:
+        pipeline: Retrieval pipeline answering the questions
+        max_concurrency: Chat turns processed at the same time
+        max_queue: Requests waiting for a slot before new ones are rejected
+        max_threads: Conversation threads kept in memory
+
+    Returns:
+        Starlette application
+    """
+    limiter = ConcurrencyLimiter(max_concurrency, max_queue)
+    threads = ThreadStore(pipeline, max_threads)
+
+    async def parse_chat_request(request: Request) -> Tuple[str, Optional[str]]:
+        """Read the message and optional thread id of a chat request."""
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise HTTPException(400, "request body must be JSON")
+        message = body.get("message") if isinstance(body, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPException(400, "message is required")
+        thread_id = body.get("thread_id")
+        if thread_id is not None and not isinstance(thread_id, str):
+            raise HTTPException(400, "thread_id must be a string")
+        return message, thread_id
+
+    def start_turn(thread_id: Optional[str]) -> Tuple[str, Callable[[], None]]:
+        """Pick the thread of a chat turn and the cleanup to run after it.
+
+        Args:
+            thread_id: Thread id of the request, if any
+
+        Returns:
+            Thread to run the turn in, and a function to call when the turn is over
+        """
+        if thread_id:
+            threads.touch(thread_id)
+            return thread_id, lambda: None
+        # without a thread id the turn has no history to keep
+        one_off = str(uuid4())
+        return one_off, lambda: threads.forget(one_off)
+
+    async def chat(request: Request) -> JSONResponse:
+        """Answer a message."""
+        message, thread_id = await parse_chat_request(request)
+        async with limiter.slot():
+            turn_thread, end_turn = start_turn(thread_id)
+            try:
+                with span("api_request", endpoint="chat"):
+                    answer, sources = await run_in_threadpool(
+                        pipeline.run, message, turn_thread
+                    )
+            finally:
+                end_turn()
+        return JSONResponse(
+            {"answer": answer, "sources": sources, "thread_id": thread_id}
+        )
+
+    async def chat_stream(request: Request) -> StreamingResponse:
+        """Answer a message as a stream of server-sent events."""
+        message, thread_id = await parse_chat_request(request)
+        # take the slot before responding so overload is still reported as 503
+        await limiter.acquire()
+        turn_thread, end_turn = start_turn(thread_id)
+
+        async def events():
+            """Yield the events of the chat turn."""
+            with span("api_request", endpoint="chat_stream"):
+                yield format_event("thread", {"thread_id": thread_id})
+                async for event, data in iterate_in_threadpool(
+                    pipeline.stream(message, turn_thread)
+                ):
+                    yield format_event(event, data)
+                yield format_event("done", {})
+
+        def close() -> None:
+            """Free the slot and clean up the turn, also if the client left early."""
+            try:
+                end_turn()
+            finally:
+                limiter.release()
+
+        return ClosingStreamingResponse(
+            events(), on_close=close, media_type="text/event-stream"
+        )
+
+    async def health(request: Request) -> JSONResponse:
+        """Report that the server is up."""
+        return JSONResponse({"status": "ok"})
+
+    async def metrics(request: Request) -> PlainTextResponse:
+        """Expose the metrics in the Prometheus text format."""
+        return PlainTextResponse(get_metrics().render_prometheus())
+
+    async def overloaded(request: Request, exc: Overloaded) -> JSONResponse:
+        """Reject a request when the queue is full."""
+        return JSONResponse(
+            {"error": "server overloaded, retry later"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+
+    async def http_error(request: Request, exc: HTTPException) -> JSONResponse:
+        """Report a client error as JSON."""
+        return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        """Size the worker thread pool for the concurrency limit."""
+        # every chat turn holds a worker thread, leave headroom for streamed steps
+        thread_limiter = anyio.to_thread.current_default_thread_limiter()
+        thread_limiter.total_tokens = max(
+            thread_limiter.total_tokens, max_concurrency + 8
+        )
+        yield
+
+    return Starlette(
+        routes=[
+            Route("/chat", chat, methods=["POST"]),
+            Route("/chat/stream", chat_stream, methods=["POST"]),
+            Route("/health", health),
+            Route("/metrics", metrics),
+        ],
+        exception_handlers={Overloaded: overloaded, HTTPException: http_error},
+        lifespan=lifespan,
+    )
+
+
+def main() -> None:
+    """Start the API server."""
+    parser = argparse.ArgumentParser(description="GovSeek API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="serve fake models and an in-memory collection for load testing",
+    )
+    parser.add_argument("--no-batching", action="store_true")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(
+        fake=args.fake,
+        batching=not args.no_batching,
+        batch_wait_ms=float(os.environ.get("API_BATCH_WAIT_MS", 5)),
+    )
+    app = create_app(
+        pipeline,
+        max_concurrency=int(os.environ.get("API_MAX_CONCURRENCY", 32)),
+        max_queue=int(os.environ.get("API_MAX_QUEUE", 128)),
+        max_threads=int(os.environ.get("API_MAX_THREADS", 10000)),
+    )
+    logger.info(f"Serving GovSeek API on {args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+"""Offline end-to-end performance benchmark of the data and retrieval pipelines.
+
+Every stage runs against local fixtures, so no OpenAI or Qdrant credentials are needed:
+    crawl: WebScraper crawling a generated site served over local HTTP
+    batch_input: combine_jsonl_files on the scraped pages
+    combine_embeddings: combine_embeddings joining synthetic batch output
+    vector_store: VectorStore bulk-loading QdrantClient(":memory:")
+    query: RetrievalPipeline answering with fake chat and embedding models
+
+Each stage runs once untimed to warm up, and the whole benchmark is repeated --runs
+times. Each stage reports the median over the runs of its throughput and p50/p95/p99
+latency. The throughput and p50 latency are compared with the baseline in
+benchmarks/baseline.json and the script exits with a non-zero code on regressions.
+p95 and p99 are reported but not gated, as the stages that run once per repeat only
+have a handful of samples. A p50 latency only regresses if it is also more than
+--slack-ms slower, so that scheduler noise on millisecond stages does not fail the
+check. The baseline depends on the hardware, so the benchmark workflow records it on
+the base commit before running the change on the same machine; without a baseline the
+script fails instead of passing trivially.
+Token counts of the batch input are approximated from the text length, as tiktoken
+downloads its encodings on first use.
+
+Usage:
+    uv run src/benchmark.py [--update-baseline] [--tolerance 0.25] [--runs 3]
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from qdrant_client import QdrantClient
+
+from data_pipeline.batch_embeddings import combine_jsonl_files
+from data_pipeline.combine_embeddings import combine_embeddings
+from data_pipeline.crawler import WebScraper
+from data_pipeline.embedding_storage import (
+    FULL_DIMENSIONS,
+    MatryoshkaEmbeddings,
+    get_embedding_dimensions,
+    get_embedding_dtype,
+)
+from data_pipeline.vector_store import VectorStore
+from retrieval_pipeline.fake_models import FakeChatModel, FakeEmbeddings
+from retrieval_pipeline.retriever import RetrievalPipeline
+
+BASELINE_PATH = Path(__file__).resolve().parents[1] / "benchmarks" / "baseline.json"
+# tail percentiles of a few samples are too noisy to gate on
+GATED_METRICS = ("throughput", "p50_ms")
+
+WORDS = (
+    "tax relief housing grant application citizen permanent resident payment "
+    "scheme employer employee contribution account income assessment deadline "
+    "eligibility renewal passport licence medical subsidy retirement savings"
+).split()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static file handler that does not log every request to stderr."""
+
+    def log_message(self, format: str, *args) -> None:
+        """Silence the request log."""
+
+
+def random_text(rng: random.Random, n_words: int) -> str:
+    """Generate filler text from a small government-services vocabulary.
+
+    Args:
+        rng: Random number generator
+        n_words: Number of words to generate
+
+    Returns:
+        Generated text
+    """
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def build_site(site_dir: Path, base_url: str, n_pages: int, seed: int = 42) -> None:
+    """Write a static site with relative links, duplicate URLs, a sitemap and robots.txt.
+
+    Args:
+        site_dir: Directory to write the site to
+        base_url: URL the site is served from, used in the sitemap
+        n_pages: Number of content pages
+        seed: Seed for the page text
+    """
+    rng = random.Random(seed)
+    site_dir.mkdir(parents=True, exist_ok=True)
+
+    for i in range(n_pages):
+        links = "".join(
+            f'<a href="page_{j}.html">Page {j}</a>'
+            f'<a href="page_{j}.html#top">Top</a>'
+            f'<a href="/page_{j}.html?utm_source=nav">Nav</a>'
+            for j in rng.sample(range(n_pages), k=min(5, n_pages))
+        )
+        paragraphs = "".join(f"<p>{random_text(rng, 80)}</p>" for _ in range(6))
+        (site_dir / f"page_{i}.html").write_text(
+            f"<html><body><h1>Page {i}</h1>{paragraphs}{links}"
+            f'<a href="private/secret.html">Private</a></body></html>'
+        )
+
+    index_links = "".join(
+        f'<a href="page_{i}.html">Page {i}</a>' for i in range(n_pages)
+    )
+    (site_dir / "index.html").write_text(
+        f"<html><body><h1>Home</h1><p>{random_text(rng, 200)}</p>{index_links}</body></html>"
+    )
+    (site_dir / "robots.txt").write_text("User-agent: *\nDisallow: /private/\n")
+    (site_dir / "sitemap.xml").write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(
+            f"<url><loc>{base_url}/page_{i}.html</loc></url>" for i in range(n_pages)
+        )
+        + "</urlset>"
+    )
+
+
+def get_fake_embeddings() -> Embeddings:
+    """Build fake query embeddings reduced like the indexed ones.
+
+    Returns:
+        Fake embeddings model for the configured storage mode
+    """
+    dimensions = get_embedding_dimensions()
+    if dimensions == FULL_DIMENSIONS:
+        return FakeEmbeddings()
+    return MatryoshkaEmbeddings(FakeEmbeddings(), dimensions)
+
+
+def approximate_tokens(text: str) -> int:
+    """Approximate the number of tokens in a text without loading a tokenizer.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Number of tokens, assuming about four characters per token
+    """
+    return len(text) // 4 + 1
+
+
+def summarise(samples: List[float], items: int, elapsed: float) -> Dict[str, float]:
+    """Summarise the latency samples and throughput of a stage.
+
+    Args:
+        samples: Latency samples in seconds
+        items: Number of items processed by the stage
+        elapsed: Wall-clock time of the stage in seconds
+
+    Returns:
+        Throughput in items per second and latency percentiles in milliseconds
+    """
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        "throughput": items / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+def timed(func: Callable, samples: List[float]) -> Callable:
+    """Wrap a function so that the latency of every call is appended to samples.
+
+    Args:
+        func: Function to wrap
+        samples: List receiving the latency of each call in seconds
+
+    Returns:
+        Wrapped function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def bench_crawl(site_dir: Path, n_pages: int, repeats: int) -> Dict[str, float]:
+    """Crawl a local site fixture with WebScraper.
+
+    Latency is measured per page fetch, parse and save.
+
+    Args:
+        site_dir: Directory to serve the site fixture from
+        n_pages: Number of content pages in the site
+        repeats: Number of crawls
+
+    Returns:
+        Stage summary
+    """
+    site_dir.mkdir(parents=True, exist_ok=True)
+    handler = functools.partial(QuietHandler, directory=str(site_dir))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"127.0.0.1:{server.server_address[1]}"
+    build_site(site_dir, f"http://{host}", n_pages)
+
+    def crawl(samples: List[float]) -> int:
+        scraper = WebScraper(
+            base_url=f"http://{host}/",
+            allowed_domain=host,
+            min_delay=0.0,
+            max_delay=0.0,
+        )
+        # the index page and every content page
+        scraper.max_pages = n_pages + 1
+        scraper.scrape_page = timed(scraper.scrape_page, samples)
+        scraper.scrape()
+        return len(scraper.visited_links)
+
+    samples = []
+    pages = 0
+    try:
+        crawl([])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            # later stages only need one crawl's output, and crawls within the same
+            # second would append to the same timestamped file
+            for file in Path("data/scraped_data").glob("*.json"):
+                file.unlink()
+            pages += crawl(samples)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return summarise(samples, pages, elapsed)
+
+
+def bench_batch_input(
+    scraped_dir: Path, work_dir: Path, repeats: int
+) -> Dict[str, float]:
+    """Build the batch API input files with combine_jsonl_files.
+
+    Latency is measured per run over the whole scraped directory.
+
+    Args:
+        scraped_dir: Directory with the scraped JSON files
+        work_dir: Directory for the batch input files
+        repeats: Number of runs
+
+    Returns:
+        Stage summary
+    """
+    n_items = sum(len(json.loads(f.read_text())) for f in scraped_dir.rglob("*.json"))
+
+    def build(run: int, samples: List[float]) -> None:
+        output_dir = work_dir / f"batch_jobs_{run}"
+        output_dir.mkdir(parents=True)
+        timed(combine_jsonl_files, samples)(
+            str(scraped_dir), str(output_dir / "batchinput.jsonl"), approximate_tokens
+        )
+
+    build(-1, [])
+    samples = []
+    start = time.perf_counter()
+    for i in range(repeats):
+        build(i, samples)
+    return summarise(samples, n_items * repeats, time.perf_counter() - start)
+
+
+def write_batch_output(scraped_dir: Path, embeddings_dir: Path) -> int:
+    """Write synthetic batch API output for every scraped chunk.
+
+    Args:
+        scraped_dir: Directory with the scraped JSON files
+        embeddings_dir: Directory to write the batch output to
+
+    Returns:
+        Number of embeddings written
+    """
+    embeddings = FakeEmbeddings()
+    embeddings_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(embeddings_dir / "batch_output.jsonl", "w") as f:
+        for file in scraped_dir.rglob("*.json"):
+            for item in json.loads(file.read_text()):
+                line = {
+                    "id": f"batch_req_{uuid4().hex}",
+                    "custom_id": item["uuid"],
+                    "response": {
+                        "body": {
+                            "data": [{"embedding": embeddings.embed_text(item["text"])}]
+                        }
+                    },
+                    "error": None,
+                }
+                f.write(json.dumps(line) + "\n")
+                count += 1
+    return count
+
+
+def bench_combine_embeddings(
+    scraped_dir: Path, embeddings_dir: Path, parquet_path: Path, repeats: int
+) -> Dict[str, float]:
+    """Join the scraped data with synthetic embeddings and write the parquet file.
+
+    Latency is measured per run over the whole corpus.
+
+    Args:
+        scraped_dir: Directory with the scraped JSON files
+        embeddings_dir: Directory with the batch output
+        parquet_path: Path of the combined parquet file
+        repeats: Number of runs
+
+    Returns:
+        Stage summary
+    """
+    n_items = write_batch_output(scraped_dir, embeddings_dir)
+
+    def combine() -> None:
+        merged_df = combine_embeddings(
+            str(scraped_dir),
+            str(embeddings_dir),
+            dimensions=get_embedding_dimensions(),
+            dtype=get_embedding_dtype(),
+            report_recall=False,
+        )
+        merged_df.to_parquet(parquet_path, engine="pyarrow")
+
+    combine()
+    samples = []
+    run = timed(combine, samples)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    return summarise(samples, n_items * repeats, time.perf_counter() - start)
+
+
+def bench_vector_store(parquet_path: Path, repeats: int) -> Dict[str, float]:
+    """Bulk-load an in-memory Qdrant collection through VectorStore.
+
+    Latency is measured per full load of the parquet file.
+
+    Args:
+        parquet_path: Path of the combined parquet file
+        repeats: Number of loads
+
+    Returns:
+        Stage summary
+    """
+
+    def load(samples: List[float]) -> int:
+        client = QdrantClient(":memory:")
+        vector_store = VectorStore(client=client, embeddings=get_fake_embeddings())
+        timed(vector_store.populate_vector_store_from_parquet, samples)(
+            str(parquet_path)
+        )
+        return client.count("demo_collection").count
+
+    load([])
+    n_items = 0
+    samples = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        n_items += load(samples)
+    return summarise(samples, n_items, time.perf_counter() - start)
+
+
+def bench_query(parquet_path: Path, n_queries: int) -> Dict[str, float]:
+    """Answer questions with RetrievalPipeline backed by fake models.
+
+    Latency is measured per question.
+
+    Args:
+        parquet_path: Path of the combined parquet file
+        n_queries: Number of questions
+
+    Returns:
+        Stage summary
+    """
+    client = QdrantClient(":memory:")
+    embeddings = get_fake_embeddings()
+    VectorStore(
+        client=client, embeddings=embeddings
+    ).populate_vector_store_from_parquet(str(parquet_path))
+    pipeline = RetrievalPipeline(
+        llm=FakeChatModel(), embeddings=embeddings, client=client
+    )
+
+    texts = pd.read_parquet(parquet_path)["text"].tolist()
+    rng = random.Random(42)
+    pipeline.run(rng.choice(texts)[:200], str(uuid4()))
+    samples = []
+    run = timed(pipeline.run, samples)
+    start = time.perf_counter()
+    for _ in range(n_queries):
+        run(rng.choice(texts)[:200], str(uuid4()))
+    return summarise(samples, n_queries, time.perf_counter() - start)
+
+
+def compare_with_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+    slack_ms: float = 0.0,
+) -> List[str]:
+    """Find the gated metrics that regressed beyond the tolerance.
+
+    Args:
+        results: Current stage summaries
+        baseline: Baseline stage summaries
+        tolerance: Allowed relative slowdown, e.g. 0.25 for 25%
+        slack_ms: Allowed absolute p50 slowdown on top of the tolerance
+
+    Returns:
+        Descriptions of the regressions
+    """
+    regressions = []
+    for stage, metrics in results.items():
+        if stage not in baseline:
+            continue
+        for metric in GATED_METRICS:
+            value = metrics[metric]
+            expected = baseline[stage].get(metric)
+            if not expected:
+                continue
+            if metric == "throughput":
+                regressed = value < expected * (1 - tolerance)
+            else:
+                regressed = value > expected * (1 + tolerance) + slack_ms
+            if regressed:
+                regressions.append(
+                    f"{stage}.{metric}: {value:.2f} vs baseline {expected:.2f}"
+                )
+    return regressions
+
+
+def run_benchmark(
+    n_pages: int, repeats: int, n_queries: int
+) -> Dict[str, Dict[str, float]]:
+    """Run every stage once in a fresh working directory.
+
+    Args:
+        n_pages: Number of content pages in the crawled site
+        repeats: Number of timed runs of the crawl, batch and indexing stages
+        n_queries: Number of questions
+
+    Returns:
+        Stage summaries
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        scraped_dir = work_dir / "data" / "scraped_data"
+        parquet_path = work_dir / "combined_embeddings.parquet"
+
+        # WebScraper writes to data/scraped_data relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            return {
+                "crawl": bench_crawl(work_dir / "site", n_pages, repeats),
+                "batch_input": bench_batch_input(scraped_dir, work_dir, repeats),
+                "combine_embeddings": bench_combine_embeddings(
+                    scraped_dir,
+                    work_dir / "generated_embeddings",
+                    parquet_path,
+                    repeats,
+                ),
+                "vector_store": bench_vector_store(parquet_path, repeats),
+                "query": bench_query(parquet_path, n_queries),
+            }
+        finally:
+            os.chdir(cwd)
+
+
+def median_results(
+    runs: List[Dict[str, Dict[str, float]]],
+) -> Dict[str, Dict[str, float]]:
+    """Take the median of every stage metric over several benchmark runs.
+
+    Args:
+        runs: Stage summaries of each run
+
+    Returns:
+        Median stage summaries
+    """
+    return {
+        stage: {
+            metric: float(np.median([run[stage][metric] for run in runs]))
+            for metric in metrics
+        }
+        for stage, metrics in runs[0].items()
+    }
+
+
+def main() -> int:
+    """Run the benchmark and compare it with the baseline.
+
+    Returns:
+        Exit code, 1 if any stage regressed or there is no baseline
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--slack-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    results = median_results(
+        [
+            run_benchmark(args.pages, args.repeats, args.queries)
+            for _ in range(args.runs)
+        ]
+    )
+
+    print(f"{'stage':<20}{'items/s':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for stage, metrics in results.items():
+        print(
+            f"{stage:<20}{metrics['throughput']:>12.1f}{metrics['p50_ms']:>12.2f}"
+            f"{metrics['p95_ms']:>12.2f}{metrics['p99_ms']:>12.2f}"
+        )
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(
+            f"No baseline at {args.baseline}, record one with --update-baseline "
+            "on the base commit first"
+        )
+        return 1
+
+    regressions = compare_with_baseline(
+        results, json.loads(args.baseline.read_text()), args.tolerance, args.slack_ms
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
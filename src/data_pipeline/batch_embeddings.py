@@ -5,9 +5,11 @@ from dotenv import load_dotenv
 import os
 from openai import OpenAI
 from pathlib import Path
+from typing import Callable
 import json
 from tqdm import tqdm
 import tiktoken
+from monitoring.metrics import increment
 
 
 def count_tokens(text: str) -> int:
@@ -24,12 +26,17 @@ def count_tokens(text: str) -> int:
     return len(encoding.encode(text))
 
 
-def combine_jsonl_files(data_dir: str, output_file: str):
+def combine_jsonl_files(
+    data_dir: str,
+    output_file: str,
+    token_counter: Callable[[str], int] = count_tokens,
+):
     """Combine multiple JSON files into a single JSONL file.
 
     Args:
         data_dir: Directory containing JSON files
         output_file: Output JSONL file
+        token_counter: Function counting the tokens of a text
     """
     file_counter = 0
     total_tokens = 0
@@ -45,8 +52,9 @@ def combine_jsonl_files(data_dir: str, output_file: str):
                 d, desc=f"Processing items in {scraped_json_file.name}", leave=False
             ):
                 # calculate the number of tokens in the text
-                tokens = count_tokens(item["text"])
+                tokens = token_counter(item["text"])
                 total_tokens += tokens
+                increment("batch_input_tokens", tokens)
 
                 # if the total number of tokens exceeds 3000000, increment file counter and write to a new file
                 if total_tokens > 3000000:
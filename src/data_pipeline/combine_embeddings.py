@@ -1,20 +1,46 @@
 """This script combines the input data and the generated embeddings into a single dataframe and saves it as a parquet file."""
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
+from loguru import logger
+from data_pipeline.embedding_storage import (
+    SUPPORTED_DTYPES,
+    get_embedding_dimensions,
+    get_embedding_dtype,
+    reduce_embeddings,
+    report_storage_tradeoff,
+)
 
-if __name__ == "__main__":
+
+def combine_embeddings(
+    scraped_data_dir: str,
+    generated_embeddings_dir: str,
+    dimensions: int,
+    dtype: str,
+    report_recall: bool = True,
+) -> pd.DataFrame:
+    """Merge the scraped data with the generated embeddings.
+
+    Args:
+        scraped_data_dir: Directory containing the scraped JSON files
+        generated_embeddings_dir: Directory containing the batch output JSONL files
+        dimensions: Number of leading dimensions to keep from each embedding
+        dtype: Storage precision of the embeddings
+        report_recall: Log the recall tradeoff of the storage modes
+
+    Returns:
+        Dataframe with the uuid, link, text and embedding columns
+    """
     dataframes = []
-    for file in Path("/workspaces/codespaces-blank/data/scraped_data").rglob("*.json"):
+    for file in Path(scraped_data_dir).rglob("*.json"):
         jsonObj = pd.read_json(path_or_buf=file)
         dataframes.append(jsonObj)
 
     input_files_df = pd.concat(dataframes, ignore_index=True)
 
     dataframes = []
-    for file in Path("/workspaces/codespaces-blank/data/generated_embeddings").rglob(
-        "*.jsonl"
-    ):
+    for file in Path(generated_embeddings_dir).rglob("*.jsonl"):
         jsonObj = pd.read_json(path_or_buf=file, lines=True)
         jsonObj["embedding"] = jsonObj["response"].apply(
             lambda x: x["body"]["data"][0]["embedding"]
@@ -34,6 +60,32 @@ if __name__ == "__main__":
     )
     merged_df.drop(columns=["custom_id"], inplace=True)
 
+    full_embeddings = np.asarray(merged_df["embedding"].tolist(), dtype=np.float32)
+    if report_recall:
+        report_storage_tradeoff(full_embeddings)
+
+    # truncate, re-normalise and downcast once for the whole matrix
+    reduced = reduce_embeddings(full_embeddings, dimensions).astype(
+        SUPPORTED_DTYPES[dtype]
+    )
+    merged_df["embedding"] = list(reduced)
+    logger.info(
+        f"Storing {len(merged_df)} embeddings with {dimensions} dims as {dtype}"
+    )
+
+    return merged_df
+
+
+if __name__ == "__main__":
+    merged_df = combine_embeddings(
+        "/workspaces/codespaces-blank/data/scraped_data",
+        "/workspaces/codespaces-blank/data/generated_embeddings",
+        dimensions=get_embedding_dimensions(),
+        dtype=get_embedding_dtype(),
+    )
+
+    # pyarrow keeps the float16 lists as half floats in the parquet file
     merged_df.to_parquet(
-        "/workspaces/codespaces-blank/data/generated_embeddings/combined_embeddings.parquet"
+        "/workspaces/codespaces-blank/data/generated_embeddings/combined_embeddings.parquet",
+        engine="pyarrow",
     )
@@ -1,9 +1,12 @@
 """WebScraper class to scrape webpages and save content to JSON files."""
 
+from collections import deque
 from typing import List, Optional
 import json
 import re
 import requests
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
 import bs4
 from loguru import logger
 from datetime import datetime
@@ -12,6 +15,7 @@ import random
 import os
 from uuid import uuid4
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from monitoring.metrics import increment, span
 
 
 class BaseScraper:
@@ -23,32 +27,29 @@ class BaseScraper:
         self.max_delay = max_delay
         self.trusted_url = "https://www.gov.sg/trusted-sites"
         self.logged_limits = False
+        self.user_agent = "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0"
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": self.user_agent})
 
-    def get_page_content(self, url: str) -> Optional[bs4.BeautifulSoup]:
-        """Fetch and parse webpage content.
+    def fetch_url(self, url: str) -> Optional[requests.Response]:
+        """Fetch a URL politely, reusing the scraper's HTTP session.
 
         Args:
-            url: URL of the webpage to fetch
+            url: URL to fetch
 
         Returns:
-            BeautifulSoup object of the webpage content
+            Response of the request, or None if the request failed
         """
         try:
             # Add sleep before making request
             time.sleep(random.uniform(self.min_delay, self.max_delay))
 
-            headers = requests.utils.default_headers()
-            headers.update(
-                {
-                    "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:52.0) Gecko/20100101 Firefox/52.0",
-                }
-            )
-            response = requests.get(
-                url, headers=headers, timeout=20
-            )  # Added 20 second timeout
+            with span("crawl_fetch"):
+                response = self.session.get(url, timeout=20)  # Added 20 second timeout
+            increment("crawl_responses", status=response.status_code)
             response.raise_for_status()
 
-            return bs4.BeautifulSoup(response.text, "html.parser")
+            return response
 
         except requests.Timeout:
             logger.error(f"Request timed out for {url}")
@@ -57,6 +58,40 @@ class BaseScraper:
             logger.error(f"Failed to fetch {url}: {e}")
             return None
 
+    def get_page_content(self, url: str) -> Optional[bs4.BeautifulSoup]:
+        """Fetch and parse webpage content.
+
+        Args:
+            url: URL of the webpage to fetch
+
+        Returns:
+            BeautifulSoup object of the webpage content
+        """
+        response = self.fetch_url(url)
+        if response is None:
+            return None
+        return self.parse_response(response, url)
+
+    def parse_response(
+        self, response: requests.Response, url: str
+    ) -> Optional[bs4.BeautifulSoup]:
+        """Parse the HTML of a fetched webpage.
+
+        Args:
+            response: Response of the request
+            url: URL of the webpage
+
+        Returns:
+            BeautifulSoup object of the webpage content, or None if it is not HTML
+        """
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and "html" not in content_type:
+            logger.debug(f"Skipping non-HTML content ({content_type}): {url}")
+            return None
+
+        with span("crawl_parse"):
+            return bs4.BeautifulSoup(response.text, "html.parser")
+
     def extract_tbody_links(self) -> List[str]:
         """Extract all links from tbody tags.
 
@@ -88,6 +123,11 @@ class BaseScraper:
 class WebScraper(BaseScraper):
     """WebScraper class to scrape webpages and save content to JSON files."""
 
+    # Query parameters that only track where a visitor came from
+    tracking_params = ("utm_", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga")
+    max_sitemaps = 10
+    max_pages = 11
+
     def __init__(
         self,
         base_url: str,
@@ -109,6 +149,10 @@ class WebScraper(BaseScraper):
         self.allowed_domain = allowed_domain
         self.max_depth = max_depth
         self.visited_links = set()  # Make sure this is initialized too
+        # Canonical URLs that were queued, scraped or not, so no page is fetched twice
+        self.seen_links = set()
+        self.frontier = deque()
+        self.robots = None
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.json_filepath = f"data/scraped_data/{"".join([x if x.isalnum() else "_" for x in self.allowed_domain])}_{self.timestamp}.json"
         logger.info(f"Initialized WebScraper for {self.base_url}")
@@ -165,14 +209,160 @@ class WebScraper(BaseScraper):
         text = re.sub(r"\s+", " ", text)
         return text.strip()
 
-    def scrape_recursively(self, url: str, depth: int = 0) -> None:
+    @classmethod
+    def canonicalize_url(cls, url: str) -> str:
+        """Normalise a URL so that links to the same page compare equal.
+
+        Lowercases the scheme and host, drops default ports, fragments, tracking
+        parameters and trailing slashes, and sorts the remaining query parameters.
+
+        Args:
+            url: Absolute URL to canonicalize
+
+        Returns:
+            Canonical form of the URL
         """
-        Recursively scrape pages while extracting content in the same pass.
+        parsed = urlparse(url.strip())
+        scheme = parsed.scheme.lower()
+        host = (parsed.hostname or "").lower()
+        try:
+            port = parsed.port
+        except ValueError:
+            port = None
+        if port and (scheme, port) not in (("http", 80), ("https", 443)):
+            host = f"{host}:{port}"
+
+        path = re.sub(r"/{2,}", "/", parsed.path) or "/"
+        if len(path) > 1:
+            path = path.rstrip("/")
+
+        query = urlencode(
+            sorted(
+                (key, value)
+                for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                if not key.lower().startswith(cls.tracking_params)
+            )
+        )
+        return urlunparse((scheme, host, path, "", query, ""))
+
+    @staticmethod
+    def strip_www(host: str) -> str:
+        """Remove the www. prefix from a host name.
 
         Args:
-            url: URL of the page to scrape
-            depth: Current depth of recursion
-            max_depth: Maximum depth to recurse
+            host: Host name, optionally with a port
+        """
+        host = host.lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def is_allowed_url(self, url: str) -> bool:
+        """Check that a URL is an allowed page that robots.txt does not block.
+
+        The host must match the allowed domain exactly (ignoring a www. prefix), so
+        look-alike hosts such as ``example.gov.sg.evil.com`` are rejected.
+
+        Args:
+            url: Canonical URL to check
+
+        Returns:
+            True if the URL may be scraped
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        if self.strip_www(parsed.netloc) != self.strip_www(self.allowed_domain):
+            return False
+        if self.robots is not None and not self.robots.can_fetch(self.user_agent, url):
+            logger.debug(f"Disallowed by robots.txt: {url}")
+            return False
+        return True
+
+    def load_robots_txt(self) -> List[str]:
+        """Load the site's robots.txt rules.
+
+        Returns:
+            Sitemap URLs declared in robots.txt
+        """
+        parsed = urlparse(self.base_url)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        response = self.fetch_url(robots_url)
+        if response is None:
+            logger.debug(f"No robots.txt found at {robots_url}")
+            return []
+
+        self.robots = RobotFileParser(robots_url)
+        self.robots.parse(response.text.splitlines())
+        return self.robots.site_maps() or []
+
+    def discover_sitemap_links(self, sitemap_urls: List[str]) -> List[str]:
+        """Collect page URLs from the site's sitemaps.
+
+        Sitemap indexes are followed up to ``max_sitemaps`` sitemap files.
+
+        Args:
+            sitemap_urls: Sitemap URLs declared in robots.txt
+
+        Returns:
+            Allowed page URLs listed in the sitemaps
+        """
+        parsed = urlparse(self.base_url)
+        pending = list(sitemap_urls) or [
+            f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"
+        ]
+        seen_sitemaps = set()
+        seen_links = set()
+        links = []
+
+        while pending and len(seen_sitemaps) < self.max_sitemaps:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen_sitemaps:
+                continue
+            seen_sitemaps.add(sitemap_url)
+
+            response = self.fetch_url(sitemap_url)
+            if response is None:
+                continue
+
+            soup = bs4.BeautifulSoup(response.content, "xml")
+            if soup.find("sitemapindex"):
+                pending.extend(loc.get_text(strip=True) for loc in soup.find_all("loc"))
+                continue
+
+            for loc in soup.find_all("loc"):
+                link = loc.get_text(strip=True)
+                key = self.canonicalize_url(link)
+                if key not in seen_links and self.is_allowed_url(key):
+                    seen_links.add(key)
+                    links.append(link)
+
+        logger.info(f"Found {len(links)} links in sitemaps")
+        return links
+
+    @staticmethod
+    def extract_links(soup: bs4.BeautifulSoup, page_url: str) -> List[str]:
+        """Resolve the links on a page to absolute URLs.
+
+        Args:
+            soup: Parsed page
+            page_url: URL the page was served from, after redirects
+
+        Returns:
+            Absolute URLs of the links on the page
+        """
+        # Relative links resolve against <base href> when the page declares one
+        base_tag = soup.find("base", href=True)
+        if base_tag:
+            page_url = urljoin(page_url, base_tag["href"])
+        return [
+            urljoin(page_url, link["href"]) for link in soup.find_all("a", href=True)
+        ]
+
+    def enqueue(self, url: str, depth: int) -> None:
+        """Add a page to the crawl frontier unless it was seen or cannot be scraped.
+
+        Args:
+            url: Absolute URL of the page
+            depth: Number of links followed from the base URL
         """
         # Check if URL points to a file
         file_extensions = (
@@ -186,60 +376,97 @@ class WebScraper(BaseScraper):
             ".mp3",
             ".mp4",
         )
-        if url.lower().endswith(file_extensions):
-            logger.debug(f"Skipping file URL: {url}")
-            return
-
-        # Check if we've already visited this link or reached max links
-        if url in self.visited_links:
-            logger.debug(f"Already visited: {url}")
+        key = self.canonicalize_url(url)
+        if key in self.seen_links:
             return
-        elif len(self.visited_links) > 10:
-            if not self.logged_limits:
-                logger.warning("Reached maximum number of links to scrape.")
-                self.logged_limits = True
+        if urlparse(key).path.lower().endswith(file_extensions):
+            logger.debug(f"Skipping file URL: {url}")
             return
-        elif depth > self.max_depth:
+        if depth > self.max_depth:
             if not self.logged_limits:
                 logger.warning("Reached maximum depth.")
                 self.logged_limits = True
             return
+        if not self.is_allowed_url(key):
+            return
+
+        self.seen_links.add(key)
+        self.frontier.append((url, depth))
+
+    def scrape_page(self, url: str, depth: int) -> None:
+        """
+        Scrape a page and add the links found on it to the frontier.
 
-        # Get and process the page content
-        soup = self.get_page_content(url)
+        Args:
+            url: URL of the page to scrape
+            depth: Number of links followed from the base URL
+        """
+        response = self.fetch_url(url)
+        if response is None:
+            return
+
+        # Links are resolved against the URL the page was served from
+        page_url = response.url or url
+        key = self.canonicalize_url(page_url)
+        if key != self.canonicalize_url(url):
+            if key in self.seen_links:
+                logger.debug(f"Already visited: {page_url}")
+                return
+            self.seen_links.add(key)
+            # a redirect may leave the site or land on a disallowed path
+            if not self.is_allowed_url(key):
+                logger.debug(f"Redirected to disallowed URL: {page_url}")
+                return
+
+        soup = self.parse_response(response, page_url)
         if not soup:
             return
 
         # Extract and save the content
-        text_content = soup.get_text()
-        cleaned_content = self.clean_text(text_content)
-
-        chunk_size = 1000
-        chunk_overlap = 100
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
-        )
+        with span("crawl_chunk"):
+            text_content = soup.get_text()
+            cleaned_content = self.clean_text(text_content)
+
+            chunk_size = 1000
+            chunk_overlap = 100
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            )
 
-        splits = text_splitter.split_text(cleaned_content)
+            splits = text_splitter.split_text(cleaned_content)
 
         for split_content in splits:
             if split_content:
-                self.save_content(url, split_content)
-                self.visited_links.add(url)
+                with span("crawl_save"):
+                    self.save_content(page_url, split_content)
+                self.visited_links.add(key)
+                increment("crawl_chunks")
                 logger.debug(f"Processed content for: {url}")
+        increment("crawl_pages")
 
-        # Find and process all links on the current page
-        for link in soup.find_all("a"):
-            href = link.get("href")
-            if href and self.allowed_domain in href and href not in self.visited_links:
-                logger.debug(f"Found new link: {href}")
-                self.scrape_recursively(href, depth + 1)
+        # Find and queue all links on the current page
+        for link in self.extract_links(soup, page_url):
+            logger.debug(f"Found link: {link}")
+            self.enqueue(link, depth + 1)
 
     def scrape(self) -> None:
         """Main scraping method."""
         logger.info(f"Starting scraping of website: {self.base_url}")
 
-        # Start the recursive scraping from the base URL
-        self.scrape_recursively(self.base_url)
+        # The sitemap pages share the breadth-first frontier with the links found on
+        # the pages, so they are reached before the page limit runs out
+        sitemap_links = self.discover_sitemap_links(self.load_robots_txt())
+        self.enqueue(self.base_url, depth=0)
+        for link in sitemap_links:
+            self.enqueue(link, depth=1)
+
+        # Only pages with saved content count towards the limit
+        while self.frontier:
+            if len(self.visited_links) >= self.max_pages:
+                logger.warning("Reached maximum number of links to scrape.")
+                break
+            url, depth = self.frontier.popleft()
+            self.scrape_page(url, depth)
+
         self.close_json_file()
         logger.info(f"Scraping completed. Processed {len(self.visited_links)} pages.")
@@ -0,0 +1,242 @@
+"""Helpers for the reduced-dimension and half-precision embedding storage mode.
+
+`text-embedding-3-small` is trained Matryoshka-style, so the leading dimensions of a
+vector can be kept on their own once the result is re-normalised. The same
+truncation and normalisation is applied when the parquet file is written, when the
+vector store is populated and when a query is embedded, so every stage agrees on
+the vector space.
+
+The mode is configured through environment variables:
+    EMBEDDING_DIMENSIONS: one of 256, 512, 768 or 1536 (default 1536)
+    EMBEDDING_DTYPE: float16 or float32 (default float32)
+"""
+
+import os
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from loguru import logger
+from qdrant_client.http.models import Datatype
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+FULL_DIMENSIONS = 1536
+SUPPORTED_DIMENSIONS = (256, 512, 768, FULL_DIMENSIONS)
+SUPPORTED_DTYPES = {"float16": np.float16, "float32": np.float32}
+
+
+def get_embedding_dimensions() -> int:
+    """Read the configured number of embedding dimensions.
+
+    Returns:
+        Number of dimensions to keep from each embedding
+    """
+    dimensions = int(os.environ.get("EMBEDDING_DIMENSIONS", FULL_DIMENSIONS))
+    if dimensions not in SUPPORTED_DIMENSIONS:
+        raise ValueError(
+            f"EMBEDDING_DIMENSIONS must be one of {SUPPORTED_DIMENSIONS}, got {dimensions}"
+        )
+    return dimensions
+
+
+def get_embedding_dtype() -> str:
+    """Read the configured storage precision of the embeddings.
+
+    Returns:
+        Name of the numpy dtype used to store embeddings
+    """
+    dtype = os.environ.get("EMBEDDING_DTYPE", "float32")
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(
+            f"EMBEDDING_DTYPE must be one of {list(SUPPORTED_DTYPES)}, got {dtype}"
+        )
+    return dtype
+
+
+def get_qdrant_datatype(dtype: str) -> Datatype:
+    """Map a storage precision to the matching Qdrant vector datatype.
+
+    Args:
+        dtype: Name of the numpy dtype used to store embeddings
+
+    Returns:
+        Qdrant vector datatype
+    """
+    return Datatype.FLOAT16 if dtype == "float16" else Datatype.FLOAT32
+
+
+def reduce_embeddings(embeddings, dimensions: int) -> np.ndarray:
+    """Truncate embeddings to the leading dimensions and re-normalise them.
+
+    Args:
+        embeddings: A single embedding or a 2D array-like of embeddings
+        dimensions: Number of leading dimensions to keep
+
+    Returns:
+        float32 array of unit-length embeddings with the requested dimensions
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def top_k_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Find the k nearest neighbours of some rows, excluding the rows themselves.
+
+    Args:
+        vectors: 2D array of unit-length embeddings
+        queries: Indices of the rows used as queries
+        k: Number of neighbours
+
+    Returns:
+        2D array with the indices of the neighbours of every query
+    """
+    scores = vectors[queries] @ vectors.T
+    scores[np.arange(len(queries)), queries] = -np.inf
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def sample_queries(n_rows: int, sample_size: int, seed: int) -> np.ndarray:
+    """Sample the corpus rows used as queries by the recall measurements.
+
+    Args:
+        n_rows: Number of rows in the corpus
+        sample_size: Number of rows to sample
+        seed: Seed for sampling the rows
+
+    Returns:
+        Indices of the sampled rows
+    """
+    rng = np.random.default_rng(seed)
+    return rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+
+
+def full_dimension_neighbours(
+    embeddings: np.ndarray, k: int = 10, sample_size: int = 200, seed: int = 42
+) -> np.ndarray:
+    """Find the top-k neighbours of the sampled queries under the full vectors.
+
+    Args:
+        embeddings: 2D array of full-dimension embeddings
+        k: Number of neighbours
+        sample_size: Number of corpus rows used as queries
+        seed: Seed for sampling the queries
+
+    Returns:
+        2D array with the indices of the neighbours of every query
+    """
+    full = reduce_embeddings(embeddings, embeddings.shape[1])
+    queries = sample_queries(len(full), sample_size, seed)
+    return top_k_neighbours(full, queries, min(k, len(full) - 1))
+
+
+def matryoshka_recall(
+    embeddings: np.ndarray,
+    dimensions: int,
+    dtype: str = "float32",
+    k: int = 10,
+    sample_size: int = 200,
+    seed: int = 42,
+    expected: Optional[np.ndarray] = None,
+) -> float:
+    """Measure how many full-dimension nearest neighbours survive the reduction.
+
+    A sample of the corpus is used as queries and the top-k neighbours under the
+    reduced vectors are compared with the top-k neighbours under the full vectors.
+
+    Args:
+        embeddings: 2D array of full-dimension embeddings
+        dimensions: Number of leading dimensions to keep
+        dtype: Storage precision applied to the reduced vectors
+        k: Number of neighbours to compare
+        sample_size: Number of corpus rows used as queries
+        seed: Seed for sampling the queries
+        expected: Neighbours from full_dimension_neighbours with the same k,
+            sample_size and seed, computed here if not given
+
+    Returns:
+        Mean recall@k of the reduced vectors against the full vectors
+    """
+    k = min(k, len(embeddings) - 1)
+    if k < 1:
+        return 1.0
+    if expected is None:
+        expected = full_dimension_neighbours(embeddings, k, sample_size, seed)
+
+    reduced = (
+        reduce_embeddings(embeddings, dimensions)
+        .astype(SUPPORTED_DTYPES[dtype])
+        .astype(np.float32)
+    )
+    queries = sample_queries(len(reduced), sample_size, seed)
+    actual = top_k_neighbours(reduced, queries, k)
+    hits = [len(set(e) & set(a)) for e, a in zip(expected, actual)]
+    return float(np.mean(hits)) / k
+
+
+def report_storage_tradeoff(embeddings: np.ndarray, k: int = 10) -> None:
+    """Log the memory footprint and recall@k of every supported storage mode.
+
+    Args:
+        embeddings: 2D array of full-dimension embeddings
+        k: Number of neighbours to compare
+    """
+    # the full-dimension neighbours are the reference for every mode
+    expected = full_dimension_neighbours(embeddings, k)
+    baseline_bytes = embeddings.shape[1] * np.dtype(np.float64).itemsize
+    for dtype in SUPPORTED_DTYPES:
+        for dimensions in SUPPORTED_DIMENSIONS:
+            vector_bytes = dimensions * np.dtype(SUPPORTED_DTYPES[dtype]).itemsize
+            recall = matryoshka_recall(
+                embeddings, dimensions, dtype=dtype, k=k, expected=expected
+            )
+            logger.info(
+                f"{dimensions:>4} dims {dtype}: {vector_bytes} bytes/vector "
+                f"({baseline_bytes / vector_bytes:.1f}x smaller than float64), "
+                f"recall@{k}={recall:.3f}"
+            )
+
+
+class MatryoshkaEmbeddings(Embeddings):
+    """Embeddings wrapper that truncates and re-normalises another model's output."""
+
+    def __init__(self, embeddings: Embeddings, dimensions: int):
+        """Initialize the wrapper.
+
+        Args:
+            embeddings: Underlying embeddings model
+            dimensions: Number of leading dimensions to keep
+        """
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents with the underlying model and reduce them."""
+        vectors = self.embeddings.embed_documents(texts)
+        return reduce_embeddings(vectors, self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query with the underlying model and reduce it."""
+        vector = self.embeddings.embed_query(text)
+        return reduce_embeddings(vector, self.dimensions).tolist()
+
+
+def get_embeddings(dimensions: Optional[int] = None) -> Embeddings:
+    """Build the query-time embeddings model for the configured storage mode.
+
+    Args:
+        dimensions: Number of dimensions to keep, defaults to EMBEDDING_DIMENSIONS
+
+    Returns:
+        Embeddings model producing vectors that match the indexed ones
+    """
+    dimensions = dimensions or get_embedding_dimensions()
+    if dimensions == FULL_DIMENSIONS:
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+    # ask the API for the reduced size and re-normalise locally so the query vectors
+    # go through exactly the same reduction as the indexed ones
+    return MatryoshkaEmbeddings(
+        OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions), dimensions
+    )
@@ -3,43 +3,88 @@
 from loguru import logger
 from dotenv import load_dotenv
 import os
-from langchain_openai import OpenAIEmbeddings
+from typing import Optional
+from langchain_core.embeddings import Embeddings
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import (
+    Distance,
+    PayloadSchemaType,
+    PointStruct,
+    VectorParams,
+)
 import pandas as pd
 from tqdm import tqdm
+from monitoring.metrics import increment, span
+from data_pipeline.embedding_storage import (
+    get_embedding_dimensions,
+    get_embedding_dtype,
+    get_embeddings,
+    get_qdrant_datatype,
+    reduce_embeddings,
+)
+from retrieval_pipeline.site_router import (
+    DOMAIN_PAYLOAD_KEY,
+    get_domain,
+    upsert_domain_centroids,
+)
 
 
 class VectorStore:
     """VectorStore class to populate the vector store with scraped data from the data pipeline."""
 
-    def __init__(self):
-        """Initialize VectorStore with OpenAI API key and Qdrant API key."""
+    def __init__(
+        self,
+        client: Optional[QdrantClient] = None,
+        embeddings: Optional[Embeddings] = None,
+    ):
+        """Initialize VectorStore with OpenAI API key and Qdrant API key.
+
+        Args:
+            client: Qdrant client to use instead of connecting to QDRANT_URL
+            embeddings: Embeddings model to use instead of the OpenAI one
+        """
         load_dotenv()
 
-        if not os.environ.get("OPENAI_API_KEY"):
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
+        self.dimensions = get_embedding_dimensions()
+        self.dtype = get_embedding_dtype()
 
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        if embeddings is None:
+            if not os.environ.get("OPENAI_API_KEY"):
+                raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-        if not os.environ.get("QDRANT_URL"):
-            raise ValueError("QDRANT_URL environment variable is not set")
+            embeddings = get_embeddings(self.dimensions)
 
-        qdrant_url = os.environ.get("QDRANT_URL")
-        qdrant_api_key = os.environ.get("QDRANT_API_KEY")
-        self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        if client is None:
+            if not os.environ.get("QDRANT_URL"):
+                raise ValueError("QDRANT_URL environment variable is not set")
+
+            qdrant_url = os.environ.get("QDRANT_URL")
+            qdrant_api_key = os.environ.get("QDRANT_API_KEY")
+            client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        self.client = client
 
         self.client.create_collection(
             collection_name="demo_collection",
-            vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+            vectors_config=VectorParams(
+                size=self.dimensions,
+                distance=Distance.COSINE,
+                datatype=get_qdrant_datatype(self.dtype),
+            ),
+        )
+        # index the domain so searches can be scoped to a few sites
+        self.client.create_payload_index(
+            collection_name="demo_collection",
+            field_name=DOMAIN_PAYLOAD_KEY,
+            field_schema=PayloadSchemaType.KEYWORD,
         )
         self.vector_store = QdrantVectorStore(
             client=self.client,
             collection_name="demo_collection",
             embedding=embeddings,
         )
-        logger.info(f"Qdrant instance created at {qdrant_url}")
+        logger.info("Qdrant collection demo_collection created")
+        logger.info(f"Storing {self.dimensions} dims embeddings as {self.dtype}")
 
     def populate_vector_store_from_parquet(self, parquet_path: str):
         """Populate the vector store from a parquet file."""
@@ -48,23 +93,40 @@ class VectorStore:
 
         logger.info(f"Populating vector store with {len(df)} rows")
 
-        for _, row in tqdm(
-            df.iterrows(), total=len(df), desc="Populating vector store"
-        ):
-            self.client.upsert(
-                collection_name="demo_collection",
-                points=[
-                    PointStruct(
-                        id=str(row["uuid"]),
-                        vector=row["embedding"],
-                        payload={
-                            "metadata": {"source": row["link"]},
-                            "page_content": row["text"],
-                        },
-                    )
-                ],
+        stored_dimensions = len(df["embedding"].iloc[0])
+        if stored_dimensions < self.dimensions:
+            raise ValueError(
+                f"{parquet_path} stores {stored_dimensions} dims embeddings, "
+                f"EMBEDDING_DIMENSIONS must be at most {stored_dimensions}"
             )
 
+        # re-apply the reduction so a full-size parquet file can be indexed in any mode
+        embeddings = reduce_embeddings(df["embedding"].tolist(), self.dimensions)
+        domains = df["link"].map(get_domain).tolist()
+
+        for (_, row), embedding, domain in tqdm(
+            zip(df.iterrows(), embeddings, domains),
+            total=len(df),
+            desc="Populating vector store",
+        ):
+            with span("index_upsert"):
+                self.client.upsert(
+                    collection_name="demo_collection",
+                    points=[
+                        PointStruct(
+                            id=str(row["uuid"]),
+                            vector=embedding.tolist(),
+                            payload={
+                                "metadata": {"source": row["link"], "domain": domain},
+                                "page_content": row["text"],
+                            },
+                        )
+                    ],
+                )
+            increment("index_points")
+
+        upsert_domain_centroids(self.client, domains, embeddings)
+
 
 if __name__ == "__main__":
     vector_store = VectorStore()
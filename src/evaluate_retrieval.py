@@ -0,0 +1,563 @@
+"""Retrieval quality-vs-latency evaluation of index and retriever configurations.
+
+A golden query set is built once from the scraped corpus and stored locally. Every
+query comes from one chunk, either as a question written by gpt-4o-mini about the
+chunk or, with --offline, as a span of the chunk with a perturbed copy of the
+chunk's embedding. The offline noise is calibrated so that an exact full-dimension
+search finds the chunk for only --target-recall of the queries, as unrelated chunks
+compete with real questions too. Offline queries still say nothing about how well
+real questions are answered, they only compare the configurations with each other.
+Each configuration then gets its own collection and is queried
+through RetrievalPipeline.retrieve_documents. Recall@k, MRR, latency percentiles
+and the estimated index memory are reported side by side.
+
+A configuration fails the quality floor when its recall@k drops more than
+--max-recall-drop below the first (baseline) configuration or under --min-recall,
+and the script then exits with a non-zero code. HNSW and quantization settings only
+take effect on a Qdrant server (--qdrant-url), the in-memory client searches exactly.
+
+Usage:
+    uv run src/evaluate_retrieval.py build-golden [--queries 200] [--offline]
+        [--target-recall 0.8]
+    uv run src/evaluate_retrieval.py run [--configs configs.json] [--qdrant-url URL]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from qdrant_client import QdrantClient, models
+
+from data_pipeline.embedding_storage import (
+    EMBEDDING_MODEL,
+    SUPPORTED_DTYPES,
+    get_qdrant_datatype,
+    reduce_embeddings,
+)
+from retrieval_pipeline.batching import document_from_point
+from retrieval_pipeline.fake_models import FakeChatModel
+from retrieval_pipeline.retriever import RetrievalPipeline
+from retrieval_pipeline.site_router import (
+    DOMAIN_PAYLOAD_KEY,
+    SiteRouter,
+    compute_domain_centroids,
+    get_domain,
+)
+
+load_dotenv()
+
+PARQUET_PATH = "data/generated_embeddings/combined_embeddings.parquet"
+GOLDEN_PATH = "data/eval/golden_queries.jsonl"
+
+QUESTION_PROMPT = (
+    "Write one question a Singapore resident might ask that is answered by the "
+    "following passage from a government website. Reply with the question only."
+    "\n\n{text}"
+)
+
+CONFIG_DEFAULTS = {
+    "dimensions": 1536,
+    "dtype": "float32",
+    "k": 2,
+    "hnsw_m": 16,
+    "hnsw_ef_construct": 100,
+    "hnsw_ef": None,
+    "quantization": None,
+    "routing": False,
+}
+
+DEFAULT_CONFIGS = [
+    {"name": "baseline"},
+    {"name": "float16", "dtype": "float16"},
+    {"name": "768d-float16", "dimensions": 768, "dtype": "float16"},
+    {"name": "512d-float16", "dimensions": 512, "dtype": "float16"},
+    {"name": "256d-float16", "dimensions": 256, "dtype": "float16"},
+    {"name": "int8-quantized", "quantization": "int8"},
+    {"name": "hnsw-m8-ef32", "hnsw_m": 8, "hnsw_ef": 32},
+    {"name": "site-routing", "routing": True},
+    {"name": "k5", "k": 5},
+]
+
+
+class LookupEmbeddings(Embeddings):
+    """Embeddings that return the stored embedding of each golden query.
+
+    Keeps the embeddings API out of the latency measurements and applies the same
+    truncation and normalisation as the configuration under test. Other texts, like
+    the probe QdrantVectorStore embeds to check the collection size, get a zero vector.
+    """
+
+    def __init__(self, vectors: Dict[str, List[float]], dimensions: int):
+        """Initialize the lookup.
+
+        Args:
+            vectors: Full-dimension embedding of every query text
+            dimensions: Number of leading dimensions to keep
+        """
+        self.vectors = vectors
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Look up the embeddings of several queries."""
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Look up the embedding of a query."""
+        if text not in self.vectors:
+            return [0.0] * self.dimensions
+        return reduce_embeddings(self.vectors[text], self.dimensions).tolist()
+
+
+def random_span(rng: random.Random, text: str, n_words: int = 12) -> str:
+    """Take a random run of words from a text.
+
+    Args:
+        rng: Random number generator
+        text: Source text
+        n_words: Number of words in the span
+
+    Returns:
+        Span of the text
+    """
+    words = text.split()
+    start = rng.randrange(max(len(words) - n_words, 0) + 1)
+    return " ".join(words[start : start + n_words])
+
+
+def exact_recall(
+    corpus: np.ndarray, targets: np.ndarray, queries: np.ndarray, k: int
+) -> float:
+    """Measure the recall@k of an exact search for the chunk each query came from.
+
+    Args:
+        corpus: Unit chunk embeddings
+        targets: Row of the source chunk of each query
+        queries: Unit query embeddings
+        k: Number of chunks retrieved per query
+
+    Returns:
+        Fraction of queries whose chunk is among the k closest
+    """
+    scores = queries @ corpus.T
+    target_scores = scores[np.arange(len(targets)), targets]
+    ranks = (scores > target_scores[:, None]).sum(axis=1)
+    return float(np.mean(ranks < k))
+
+
+def calibrate_noise(
+    corpus: np.ndarray,
+    targets: np.ndarray,
+    directions: np.ndarray,
+    target_recall: float,
+    k: int,
+    iterations: int = 20,
+) -> float:
+    """Find the noise norm at which offline queries reach the target recall.
+
+    Args:
+        corpus: Unit chunk embeddings
+        targets: Row of the source chunk of each query
+        directions: Unit noise direction of each query
+        target_recall: Recall@k of an exact search to calibrate to
+        k: Number of chunks retrieved per query
+        iterations: Number of bisection steps
+
+    Returns:
+        Norm of the noise added to the unit chunk embeddings
+    """
+
+    def recall(noise: float) -> float:
+        queries = reduce_embeddings(
+            corpus[targets] + noise * directions, corpus.shape[1]
+        )
+        return exact_recall(corpus, targets, queries, k)
+
+    low, high = 0.0, 1.0
+    while recall(high) > target_recall:
+        if high >= 1e4:
+            logger.warning(f"Offline recall stays above {target_recall} at any noise")
+            return high
+        low, high = high, high * 2
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if recall(middle) > target_recall:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def build_golden_set(
+    parquet_path: str,
+    output_path: str,
+    n_queries: int,
+    offline: bool = False,
+    target_recall: float = 0.8,
+    seed: int = 42,
+) -> None:
+    """Sample chunks from the corpus and write one golden query per chunk.
+
+    Args:
+        parquet_path: Combined embeddings parquet file
+        output_path: JSONL file the golden queries are written to
+        n_queries: Number of queries
+        offline: Use text spans and perturbed chunk embeddings instead of OpenAI
+        target_recall: Baseline recall@k the offline noise is calibrated to
+        seed: Seed for sampling the chunks
+    """
+    df = pd.read_parquet(parquet_path)
+    sample = df.sample(n=min(n_queries, len(df)), random_state=seed)
+    rng = random.Random(seed)
+
+    if offline:
+        queries = [random_span(rng, text) for text in sample["text"]]
+        corpus = np.asarray(df["embedding"].tolist(), dtype=np.float32)
+        corpus = reduce_embeddings(corpus, corpus.shape[1])
+        targets = df.index.get_indexer(sample.index)
+        directions = np.random.default_rng(seed).standard_normal(
+            (len(targets), corpus.shape[1])
+        )
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        noise = calibrate_noise(
+            corpus, targets, directions, target_recall, CONFIG_DEFAULTS["k"]
+        )
+        logger.info(f"Offline query noise {noise:.2f} for recall@k {target_recall}")
+        embeddings = reduce_embeddings(
+            corpus[targets] + noise * directions, corpus.shape[1]
+        )
+    else:
+        from langchain.chat_models import init_chat_model
+        from langchain_openai import OpenAIEmbeddings
+
+        if not os.environ.get("OPENAI_API_KEY"):
+            raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+        llm = init_chat_model("gpt-4o-mini", model_provider="openai")
+        responses = llm.batch(
+            [QUESTION_PROMPT.format(text=text) for text in sample["text"]],
+            config={"max_concurrency": 8},
+        )
+        queries = [response.content.strip() for response in responses]
+        embeddings = np.asarray(
+            OpenAIEmbeddings(model=EMBEDDING_MODEL).embed_documents(queries)
+        )
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        for query, (_, row), embedding in zip(queries, sample.iterrows(), embeddings):
+            line = {
+                "query": query,
+                "uuid": str(row["uuid"]),
+                "link": row["link"],
+                "embedding": np.asarray(embedding, dtype=np.float32).tolist(),
+            }
+            f.write(json.dumps(line) + "\n")
+    logger.info(f"Wrote {len(queries)} golden queries to {output_path}")
+
+
+def build_collection(
+    client: QdrantClient,
+    collection_name: str,
+    df: pd.DataFrame,
+    embeddings: np.ndarray,
+    config: dict,
+) -> None:
+    """Create and fill the collection of a configuration.
+
+    Args:
+        client: Qdrant client
+        collection_name: Name of the collection
+        df: Corpus with uuid, link and text columns
+        embeddings: 2D array of embeddings reduced to the configured dimensions
+        config: Configuration under test
+    """
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+
+    quantization_config = None
+    if config["quantization"] == "int8":
+        quantization_config = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, always_ram=True
+            )
+        )
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=config["dimensions"],
+            distance=models.Distance.COSINE,
+            datatype=get_qdrant_datatype(config["dtype"]),
+        ),
+        hnsw_config=models.HnswConfigDiff(
+            m=config["hnsw_m"], ef_construct=config["hnsw_ef_construct"]
+        ),
+        quantization_config=quantization_config,
+    )
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=DOMAIN_PAYLOAD_KEY,
+        field_schema=models.PayloadSchemaType.KEYWORD,
+    )
+    client.upload_collection(
+        collection_name=collection_name,
+        ids=df["uuid"].astype(str).tolist(),
+        vectors=embeddings.tolist(),
+        payload=[
+            {
+                "metadata": {"source": link, "domain": get_domain(link)},
+                "page_content": text,
+            }
+            for link, text in zip(df["link"], df["text"])
+        ],
+        batch_size=256,
+        wait=True,
+    )
+
+
+def estimate_index_bytes(n_points: int, config: dict) -> int:
+    """Estimate the memory of the vectors and the HNSW graph of a collection.
+
+    Args:
+        n_points: Number of points in the collection
+        config: Configuration of the collection
+
+    Returns:
+        Estimated size in bytes
+    """
+    itemsize = np.dtype(SUPPORTED_DTYPES[config["dtype"]]).itemsize
+    vector_bytes = n_points * config["dimensions"] * itemsize
+    if config["quantization"] == "int8":
+        vector_bytes += n_points * config["dimensions"]
+    # layer 0 of the HNSW graph keeps 2 * m links of 4 bytes per point
+    graph_bytes = n_points * 2 * config["hnsw_m"] * 4
+    return vector_bytes + graph_bytes
+
+
+def evaluate_config(
+    client: QdrantClient,
+    df: pd.DataFrame,
+    full_embeddings: np.ndarray,
+    golden: List[dict],
+    config: dict,
+) -> Dict[str, float]:
+    """Measure the quality and latency of one configuration.
+
+    Args:
+        client: Qdrant client
+        df: Corpus with uuid, link and text columns
+        full_embeddings: 2D array of the stored embeddings
+        golden: Golden queries
+        config: Configuration under test
+
+    Returns:
+        Recall@k, MRR, latency percentiles and estimated index size
+    """
+    collection_name = f"eval_{config['name']}"
+    embeddings = reduce_embeddings(full_embeddings, config["dimensions"])
+    try:
+        build_collection(client, collection_name, df, embeddings, config)
+
+        search_params = models.SearchParams(
+            hnsw_ef=config["hnsw_ef"],
+            quantization=models.QuantizationSearchParams(rescore=True)
+            if config["quantization"]
+            else None,
+        )
+
+        def search(embedding, k, query_filter=None):
+            """Search the collection with the configured search parameters."""
+            response = client.query_points(
+                collection_name=collection_name,
+                query=embedding,
+                limit=k,
+                query_filter=query_filter,
+                search_params=search_params,
+                with_payload=True,
+            )
+            return [
+                document_from_point(point, collection_name) for point in response.points
+            ]
+
+        router = None
+        if config["routing"]:
+            domains, centroids = compute_domain_centroids(
+                df["link"].map(get_domain).tolist(), embeddings
+            )
+            router = SiteRouter(domains, centroids)
+
+        pipeline = RetrievalPipeline(
+            llm=FakeChatModel(),
+            embeddings=LookupEmbeddings(
+                {item["query"]: item["embedding"] for item in golden},
+                config["dimensions"],
+            ),
+            client=client,
+            search=search,
+            router=router,
+            routing=config["routing"],
+            collection_name=collection_name,
+            k=config["k"],
+        )
+
+        hits, reciprocal_ranks, latencies = [], [], []
+        for item in golden:
+            start = time.perf_counter()
+            docs = pipeline.retrieve_documents(item["query"])
+            latencies.append(time.perf_counter() - start)
+
+            ids = [str(doc.metadata["_id"]) for doc in docs]
+            rank = ids.index(item["uuid"]) + 1 if item["uuid"] in ids else None
+            hits.append(rank is not None)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+    finally:
+        # leave no evaluation collections behind on a Qdrant server
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "recall": float(np.mean(hits)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "index_mb": estimate_index_bytes(len(df), config) / 2**20,
+    }
+
+
+def run_evaluation(
+    parquet_path: str,
+    golden_path: str,
+    configs: List[dict],
+    qdrant_url: Optional[str],
+    max_recall_drop: float,
+    min_recall: float,
+    output_path: Optional[Path] = None,
+) -> int:
+    """Evaluate every configuration and check it against the quality floor.
+
+    Args:
+        parquet_path: Combined embeddings parquet file
+        golden_path: JSONL file with the golden queries
+        configs: Configurations to evaluate, the first one is the baseline
+        qdrant_url: Qdrant server to evaluate on, in-memory if None
+        max_recall_drop: Allowed recall@k drop below the baseline
+        min_recall: Minimum recall@k of every configuration
+        output_path: JSON file the results are written to
+
+    Returns:
+        Exit code, 1 if any configuration is below the quality floor
+    """
+    df = pd.read_parquet(parquet_path)
+    full_embeddings = np.asarray(df["embedding"].tolist(), dtype=np.float32)
+    with open(golden_path) as f:
+        golden = [json.loads(line) for line in f]
+
+    if qdrant_url:
+        client = QdrantClient(url=qdrant_url, api_key=os.environ.get("QDRANT_API_KEY"))
+    else:
+        logger.warning(
+            "Evaluating in memory, HNSW and quantization settings have no effect"
+        )
+        client = QdrantClient(":memory:")
+
+    baseline = {**CONFIG_DEFAULTS, **configs[0]}
+    if baseline["dimensions"] > full_embeddings.shape[1]:
+        raise ValueError(
+            f"Baseline config {baseline['name']} needs {baseline['dimensions']} dims, "
+            f"the parquet file only stores {full_embeddings.shape[1]}"
+        )
+
+    print(
+        f"{'config':<18}{'k':>3}{'recall@k':>10}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'index MB':>10}  floor"
+    )
+    results = []
+    floor = None
+    for config in configs:
+        config = {**CONFIG_DEFAULTS, **config}
+        if config["dimensions"] > full_embeddings.shape[1]:
+            logger.warning(
+                f"Skipping {config['name']}: the parquet file only stores "
+                f"{full_embeddings.shape[1]} dims"
+            )
+            continue
+
+        result = evaluate_config(client, df, full_embeddings, golden, config)
+        if floor is None:
+            floor = max(min_recall, result["recall"] - max_recall_drop)
+        passed = result["recall"] >= floor
+        results.append({**config, **result, "passed": passed})
+        print(
+            f"{config['name']:<18}{config['k']:>3}{result['recall']:>10.3f}"
+            f"{result['mrr']:>8.3f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+            f"{result['p99_ms']:>9.2f}{result['index_mb']:>10.1f}  "
+            f"{'PASS' if passed else 'FAIL'}"
+        )
+
+    print(f"quality floor: recall@k >= {floor:.3f}, set by config {baseline['name']}")
+
+    if output_path:
+        output_path.write_text(json.dumps(results, indent=2))
+    return 0 if all(result["passed"] for result in results) else 1
+
+
+def main() -> int:
+    """Build the golden query set or run the evaluation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    golden_parser = subparsers.add_parser("build-golden")
+    golden_parser.add_argument("--parquet", default=PARQUET_PATH)
+    golden_parser.add_argument("--output", default=GOLDEN_PATH)
+    golden_parser.add_argument("--queries", type=int, default=200)
+    golden_parser.add_argument("--offline", action="store_true")
+    golden_parser.add_argument("--target-recall", type=float, default=0.8)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--parquet", default=PARQUET_PATH)
+    run_parser.add_argument("--golden", default=GOLDEN_PATH)
+    run_parser.add_argument("--configs", type=Path)
+    run_parser.add_argument("--qdrant-url")
+    run_parser.add_argument("--max-recall-drop", type=float, default=0.02)
+    run_parser.add_argument("--min-recall", type=float, default=0.0)
+    run_parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    if args.command == "build-golden":
+        build_golden_set(
+            args.parquet,
+            args.output,
+            args.queries,
+            offline=args.offline,
+            target_recall=args.target_recall,
+        )
+        return 0
+
+    configs = json.loads(args.configs.read_text()) if args.configs else DEFAULT_CONFIGS
+    return run_evaluation(
+        args.parquet,
+        args.golden,
+        configs,
+        args.qdrant_url,
+        args.max_recall_drop,
+        args.min_recall,
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Local load test of the API server with fake models.
+
+Simulated users send chat requests back to back against the in-process ASGI app,
+with and without micro-batching, and the throughput, latency percentiles, rejected
+requests and embeddings API calls are reported for each concurrency level. The fake
+embeddings model sleeps per request and allows a limited number of requests at the
+same time, like a rate-limited embeddings API.
+
+Usage:
+    uv run src/load_test.py [--users 1 8 32] [--requests-per-user 10]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+from loguru import logger
+
+from api_server import build_pipeline, create_app
+
+
+async def run_load(app, users: int, requests_per_user: int) -> Dict[str, float]:
+    """Send chat requests from concurrent users and measure them.
+
+    Args:
+        app: ASGI application
+        users: Number of concurrent users
+        requests_per_user: Requests sent by each user one after another
+
+    Returns:
+        Throughput, latency percentiles and number of rejected requests
+    """
+    latencies: List[float] = []
+    rejected = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://govseek", timeout=120
+    ) as client:
+
+        async def user(user_id: int) -> None:
+            """Send requests one after another."""
+            nonlocal rejected
+            for i in range(requests_per_user):
+                start = time.perf_counter()
+                response = await client.post(
+                    "/chat",
+                    json={"message": f"How do I renew my passport? ({user_id}-{i})"},
+                )
+                if response.status_code == 503:
+                    rejected += 1
+                    continue
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(u) for u in range(users)))
+        elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "rejected": rejected,
+    }
+
+
+def main() -> None:
+    """Run the load test with and without micro-batching."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-user", type=int, default=10)
+    parser.add_argument("--embedding-latency-ms", type=float, default=100.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=100.0)
+    parser.add_argument("--embedding-concurrency", type=int, default=2)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=128)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    print(
+        f"{'batching':<10}{'users':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'rejected':>10}{'embed calls':>13}"
+    )
+    for batching in (False, True):
+        for users in args.users:
+            pipeline = build_pipeline(
+                fake=True,
+                batching=batching,
+                fake_embedding_latency_ms=args.embedding_latency_ms,
+                fake_llm_latency_ms=args.llm_latency_ms,
+                fake_embedding_concurrency=args.embedding_concurrency,
+                fake_corpus_size=200,
+            )
+            embeddings = getattr(pipeline.embeddings, "embeddings", pipeline.embeddings)
+            calls_before = embeddings.calls
+            app = create_app(pipeline, args.max_concurrency, args.max_queue)
+
+            result = asyncio.run(run_load(app, users, args.requests_per_user))
+            print(
+                f"{str(batching):<10}{users:>6}{result['throughput']:>10.1f}"
+                f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                f"{result['p99_ms']:>10.1f}{result['rejected']:>10}"
+                f"{embeddings.calls - calls_before:>13}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Timing spans and counters for the crawl, index and query pipelines.
+
+Metrics are configured through environment variables:
+    METRICS_EXPORTER: jsonl or prometheus, unset to disable (default)
+    METRICS_PATH: file the metrics are written to
+        (default logs/metrics.jsonl or logs/metrics.prom)
+
+The jsonl exporter appends one line per span and counter update as it happens, so
+no events are lost when the process is killed. The prometheus
+exporter aggregates spans into histograms and counters into totals and writes them
+in the Prometheus text format every 10 seconds and on exit, e.g. for the node
+exporter's textfile collector.
+
+When metrics are disabled, `span` returns a shared no-op context manager and
+`increment` returns straight away, so instrumented code pays one function call.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Optional, TextIO, Tuple
+
+EXPORTERS = ("jsonl", "prometheus")
+DEFAULT_PATHS = {"jsonl": "logs/metrics.jsonl", "prometheus": "logs/metrics.prom"}
+EXPORT_INTERVAL = 10.0
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "govseek"
+
+NULL_SPAN = nullcontext()
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Span:
+    """Context manager that records its duration on exit."""
+
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        """Initialize the span.
+
+        Args:
+            metrics: Metrics registry receiving the duration
+            name: Name of the span
+            labels: Labels attached to the span
+        """
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "Span":
+        """Start the timer."""
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Stop the timer and record the duration."""
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.labels)
+
+
+class Metrics:
+    """Registry of span durations and counters with a JSON-lines or Prometheus exporter."""
+
+    def __init__(self, exporter: Optional[str] = None, path: Optional[str] = None):
+        """Initialize the registry.
+
+        Args:
+            exporter: jsonl, prometheus or None to disable metrics
+            path: File the metrics are written to
+        """
+        if exporter is not None and exporter not in EXPORTERS:
+            raise ValueError(
+                f"METRICS_EXPORTER must be one of {EXPORTERS}, got {exporter}"
+            )
+
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.path = path or DEFAULT_PATHS.get(exporter)
+        self.lock = threading.Lock()
+        self.histograms: Dict[LabelKey, List[float]] = {}
+        self.counters: Dict[LabelKey, float] = {}
+        # jsonl file, opened on the first event and line buffered
+        self.file: Optional[TextIO] = None
+        self.last_export = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        """Create the registry configured by METRICS_EXPORTER and METRICS_PATH."""
+        return cls(
+            exporter=os.environ.get("METRICS_EXPORTER") or None,
+            path=os.environ.get("METRICS_PATH") or None,
+        )
+
+    @staticmethod
+    def key(name: str, labels: Dict[str, str]) -> LabelKey:
+        """Build the registry key of a metric."""
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def log_line(self, record: dict) -> None:
+        """Append a JSON line to the metrics file. Must hold the lock."""
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a", buffering=1)
+        self.file.write(json.dumps(record) + "\n")
+
+    def observe(self, name: str, seconds: float, labels: Dict[str, str]) -> None:
+        """Record the duration of a span.
+
+        Args:
+            name: Name of the span
+            seconds: Duration of the span
+            labels: Labels attached to the span
+        """
+        key = self.key(name, labels)
+        with self.lock:
+            # [count, sum, bucket_0, ..., bucket_n]
+            histogram = self.histograms.setdefault(key, [0, 0.0] + [0] * len(BUCKETS))
+            histogram[0] += 1
+            histogram[1] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[2 + i] += 1
+
+            if self.exporter == "jsonl":
+                self.log_line(
+                    {
+                        "ts": time.time(),
+                        "type": "span",
+                        "name": name,
+                        "labels": labels,
+                        "duration_ms": seconds * 1000,
+                    }
+                )
+        self.maybe_export()
+
+    def add(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        """Add to a counter.
+
+        Args:
+            name: Name of the counter
+            value: Amount to add
+            labels: Labels attached to the counter
+        """
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+            if self.exporter == "jsonl":
+                self.log_line(
+                    {
+                        "ts": time.time(),
+                        "type": "counter",
+                        "name": name,
+                        "labels": labels,
+                        "value": value,
+                    }
+                )
+        self.maybe_export()
+
+    def maybe_export(self) -> None:
+        """Rewrite the Prometheus file once EXPORT_INTERVAL has passed since the last write."""
+        if self.exporter != "prometheus":
+            return
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_export < EXPORT_INTERVAL:
+                return
+            self.last_export = now
+        self.export()
+
+    def render_prometheus(self) -> str:
+        """Render the aggregated metrics in the Prometheus text format.
+
+        Returns:
+            Metrics in the Prometheus exposition format
+        """
+
+        def metric_name(name: str) -> str:
+            return f"{PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+        def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+            if not labels:
+                return ""
+            escaped = (
+                (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in labels
+            )
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        with self.lock:
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        typed = set()
+        for (name, labels), histogram in histograms:
+            full_name = f"{metric_name(name)}_seconds"
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} histogram")
+                typed.add(full_name)
+            for bound, count in zip(BUCKETS, histogram[2:]):
+                bucket_labels = format_labels(labels + (("le", str(bound)),))
+                lines.append(f"{full_name}_bucket{bucket_labels} {count}")
+            inf_labels = format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{full_name}_bucket{inf_labels} {histogram[0]}")
+            lines.append(f"{full_name}_sum{format_labels(labels)} {histogram[1]}")
+            lines.append(f"{full_name}_count{format_labels(labels)} {histogram[0]}")
+
+        for (name, labels), value in counters:
+            full_name = f"{metric_name(name)}_total"
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} counter")
+                typed.add(full_name)
+            lines.append(f"{full_name}{format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        """Write the metrics to the configured file."""
+        if self.exporter == "jsonl":
+            with self.lock:
+                if self.file is not None:
+                    self.file.flush()
+        elif self.exporter == "prometheus":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # write and rename so scrapers never read a half-written file
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, self.path)
+
+
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry, creating it from the environment."""
+    global _metrics
+    if _metrics is None:
+        configure_metrics(Metrics.from_env())
+    return _metrics
+
+
+def configure_metrics(metrics: Metrics) -> Metrics:
+    """Replace the process-wide metrics registry.
+
+    Args:
+        metrics: Registry to use from now on
+
+    Returns:
+        The registry
+    """
+    global _metrics
+    if _metrics is not None and _metrics.enabled:
+        _metrics.export()
+    _metrics = metrics
+    return metrics
+
+
+def span(name: str, **labels: str):
+    """Time a block of code.
+
+    Args:
+        name: Name of the span, e.g. crawl_fetch
+        labels: Labels attached to the span
+
+    Returns:
+        Context manager recording the duration of the block
+    """
+    metrics = _metrics or get_metrics()
+    if not metrics.enabled:
+        return NULL_SPAN
+    return Span(metrics, name, labels)
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    """Add to a counter.
+
+    Args:
+        name: Name of the counter, e.g. llm_input_tokens
+        value: Amount to add
+        labels: Labels attached to the counter
+    """
+    metrics = _metrics or get_metrics()
+    if metrics.enabled:
+        metrics.add(name, value, labels)
+
+
+@atexit.register
+def export_on_exit() -> None:
+    """Write any remaining metrics when the process exits."""
+    if _metrics is not None and _metrics.enabled:
+        _metrics.export()
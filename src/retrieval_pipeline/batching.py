@@ -0,0 +1,236 @@
+"""Micro-batching of query embeddings and Qdrant searches across concurrent requests.
+
+Each chat turn embeds one query and runs one search. When many users are served at
+once, the calls made within a few milliseconds of each other are collected and sent
+as one embeddings request and one batched Qdrant query instead.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient, models
+
+from monitoring.metrics import increment, span
+
+
+def document_from_point(point: models.ScoredPoint, collection_name: str) -> Document:
+    """Convert a Qdrant search result to a document, like langchain_qdrant does.
+
+    Args:
+        point: Search result
+        collection_name: Collection the point came from
+
+    Returns:
+        Document with the page content and metadata of the point, and its
+        similarity in the _score metadata
+    """
+    return Document(
+        id=str(point.id),
+        page_content=point.payload.get("page_content", ""),
+        metadata={
+            **(point.payload.get("metadata") or {}),
+            "_id": point.id,
+            "_collection_name": collection_name,
+            "_score": point.score,
+        },
+    )
+
+
+class MicroBatcher:
+    """Collect concurrent calls over a short window and process them as one batch.
+
+    A worker thread waits for the first item, keeps collecting until ``max_wait_ms``
+    has passed or ``max_batch_size`` items are queued, and hands the batch to a
+    thread pool so up to ``max_inflight`` batches run at the same time. While all
+    batches are in flight the worker stops collecting, so items queue up and the
+    batches grow with the load.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], List[Any]],
+        name: str,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_inflight: int = 4,
+        timeout: float = 60.0,
+    ):
+        """Initialize the batcher and start its worker thread.
+
+        Args:
+            process: Function mapping a list of items to a list of results
+            name: Name used for the metrics of the batcher
+            max_batch_size: Maximum number of items in a batch
+            max_wait_ms: Maximum time the first item of a batch waits for others
+            max_inflight: Maximum number of batches processed at the same time
+            timeout: Seconds a caller waits for its result before giving up
+        """
+        self.process = process
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self.queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self.inflight = threading.BoundedSemaphore(max_inflight)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_inflight, thread_name_prefix=f"{name}-batch"
+        )
+        self.worker = threading.Thread(target=self.collect, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, item: Any) -> Any:
+        """Add an item to the next batch and wait for its result.
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result of the item
+
+        Raises:
+            TimeoutError: If the result is not ready within the timeout
+        """
+        future: Future = Future()
+        self.queue.put((item, future))
+        return future.result(timeout=self.timeout)
+
+    def collect(self) -> None:
+        """Group queued items into batches until the batcher is closed."""
+        while True:
+            self.inflight.acquire()
+            first = self.queue.get()
+            if first is None:
+                self.inflight.release()
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self.queue.put(None)
+                    break
+                batch.append(entry)
+
+            self.executor.submit(self.run_batch, batch)
+
+    def run_batch(self, batch: List[Tuple[Any, Future]]) -> None:
+        """Process a batch and resolve the futures of its items.
+
+        Args:
+            batch: Items and their futures
+        """
+        items = [item for item, _ in batch]
+        try:
+            with span("batch", batcher=self.name):
+                results = self.process(items)
+            increment("batch_calls", batcher=self.name)
+            increment("batch_items", len(items), batcher=self.name)
+            # fail every item rather than leave some unresolved on a short result
+            pairs = list(zip(batch, results, strict=True))
+            for (_, future), result in pairs:
+                future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.inflight.release()
+
+    def close(self) -> None:
+        """Stop the worker once the queued items are batched."""
+        self.queue.put(None)
+        self.worker.join()
+        self.executor.shutdown(wait=True)
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces concurrent query embeddings into one request."""
+
+    def __init__(self, embeddings: Embeddings, **batcher_kwargs: Any):
+        """Initialize the wrapper.
+
+        Args:
+            embeddings: Underlying embeddings model
+            batcher_kwargs: Arguments passed to MicroBatcher
+        """
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(
+            embeddings.embed_documents, name="query_embed", **batcher_kwargs
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents with the underlying model, they are already a batch."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query together with the queries of other concurrent requests."""
+        return self.batcher.submit(text)
+
+
+class BatchedQdrantSearch:
+    """Coalesces concurrent vector searches into one Qdrant batch query."""
+
+    def __init__(
+        self, client: QdrantClient, collection_name: str, **batcher_kwargs: Any
+    ):
+        """Initialize the batched search.
+
+        Args:
+            client: Qdrant client
+            collection_name: Collection to search
+            batcher_kwargs: Arguments passed to MicroBatcher
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.batcher = MicroBatcher(
+            self.search_batch, name="query_search", **batcher_kwargs
+        )
+
+    def search_batch(
+        self, requests: List[Tuple[List[float], int, Optional[models.Filter]]]
+    ) -> List[List[Document]]:
+        """Run several searches in one Qdrant request.
+
+        Args:
+            requests: Query embeddings, their number of results and payload filters
+
+        Returns:
+            Closest documents of every request
+        """
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=embedding, limit=k, filter=query_filter, with_payload=True
+                )
+                for embedding, k, query_filter in requests
+            ],
+        )
+        return [
+            [
+                document_from_point(point, self.collection_name)
+                for point in response.points
+            ]
+            for response in responses
+        ]
+
+    def __call__(
+        self,
+        embedding: List[float],
+        k: int,
+        query_filter: Optional[models.Filter] = None,
+    ) -> List[Document]:
+        """Search the collection together with the searches of other concurrent requests."""
+        return self.batcher.submit((embedding, k, query_filter))
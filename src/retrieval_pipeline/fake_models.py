@@ -0,0 +1,118 @@
+"""Offline stand-ins for the OpenAI chat and embedding models, used for benchmarks and load tests."""
+
+import hashlib
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, List, Optional
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that calls the retrieve tool once per question and then answers.
+
+    The router step sees only the conversation and always emits a `retrieve` tool
+    call with the latest question. The generation step starts with the system
+    prompt holding the retrieved context and gets a canned answer.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        """Return the type of the chat model."""
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any) -> "FakeChatModel":
+        """Accept tools without changing the model, the tool call is hard-coded."""
+        return self
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """Generate a tool call for the router step or an answer for the generation step."""
+        time.sleep(self.latency)
+
+        if messages[0].type == "system":
+            message = AIMessage(
+                content=f"Answer based on {len(messages[0].content)} characters of context."
+            )
+        else:
+            question = next(m.content for m in reversed(messages) if m.type == "human")
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": "retrieve",
+                        "args": {"query": question},
+                        "id": f"call_{uuid4().hex}",
+                    }
+                ],
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings seeded by a hash of the text.
+
+    The same text always maps to the same vector, so a chunk used as a query finds
+    itself. ``latency`` is slept once per call to model the round trip of an API
+    request, regardless of how many texts are embedded in the call, and
+    ``max_concurrent_calls`` models the rate limit of the API.
+    """
+
+    def __init__(
+        self,
+        size: int = 1536,
+        latency: float = 0.0,
+        max_concurrent_calls: Optional[int] = None,
+    ):
+        """Initialize the fake embeddings.
+
+        Args:
+            size: Number of dimensions of the vectors
+            latency: Seconds slept per call
+            max_concurrent_calls: Calls allowed at the same time, unlimited if None
+        """
+        self.size = size
+        self.latency = latency
+        self.slots = (
+            threading.BoundedSemaphore(max_concurrent_calls)
+            if max_concurrent_calls
+            else nullcontext()
+        )
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def request(self) -> None:
+        """Simulate the round trip of an API request."""
+        with self.calls_lock:
+            self.calls += 1
+        with self.slots:
+            time.sleep(self.latency)
+
+    def embed_text(self, text: str) -> List[float]:
+        """Embed a single text without sleeping."""
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents."""
+        self.request()
+        return [self.embed_text(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query."""
+        self.request()
+        return self.embed_text(text)
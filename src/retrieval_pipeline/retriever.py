@@ -7,21 +7,53 @@ from langgraph.graph import MessagesState, StateGraph
 from langchain_core.tools import tool
 from langchain_core.messages import SystemMessage
 from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END
 from langgraph.prebuilt import tools_condition
 from langchain.chat_models import init_chat_model
 from langchain_qdrant import QdrantVectorStore
 import os
-from langchain_openai import OpenAIEmbeddings
+from data_pipeline.embedding_storage import get_embeddings
 from dotenv import load_dotenv
 from langgraph.checkpoint.memory import MemorySaver
-from typing import List, TypedDict
-from langchain_core.messages import AIMessage
+from typing import Callable, Iterator, List, Optional, Tuple, TypedDict, Union
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from qdrant_client import QdrantClient, models
+from retrieval_pipeline.site_router import SiteRouter, domain_filter
+from langchain_core.messages import AIMessage, AIMessageChunk
+from monitoring.metrics import increment, span
 import re
 
 load_dotenv()
 
 
+def record_token_usage(message: AIMessage, node: str) -> None:
+    """Count the tokens used by a chat model call, including prompt cache hits.
+
+    Args:
+        message: Response of the chat model
+        node: Graph node that made the call
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    increment("llm_input_tokens", usage.get("input_tokens", 0), node=node)
+    increment("llm_output_tokens", usage.get("output_tokens", 0), node=node)
+    cache_read = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    increment("llm_cached_input_tokens", cache_read or 0, node=node)
+
+
+def best_score(docs: List[Document]) -> float:
+    """Return the highest similarity of the retrieved documents.
+
+    Args:
+        docs: Documents with their similarity in the _score metadata
+    """
+    return max((doc.metadata.get("_score", 0.0) for doc in docs), default=0.0)
+
+
 class ConfigSchema(TypedDict):
     """Config schema for the retrieval pipeline."""
 
@@ -29,22 +61,59 @@ class ConfigSchema(TypedDict):
 
 
 class RetrievalPipeline:
-    def __init__(self):
-        """Initialize the retrieval pipeline."""
+    def __init__(
+        self,
+        llm: Optional[BaseChatModel] = None,
+        embeddings: Optional[Embeddings] = None,
+        client: Optional[QdrantClient] = None,
+        search: Optional[Callable[..., List[Document]]] = None,
+        router: Optional[SiteRouter] = None,
+        routing: bool = True,
+        collection_name: str = "demo_collection",
+        k: int = 2,
+        min_route_score: float = 0.3,
+    ):
+        """Initialize the retrieval pipeline.
+
+        Args:
+            llm: Chat model to use instead of gpt-4o-mini
+            embeddings: Embeddings model to use instead of the OpenAI one
+            client: Qdrant client to use instead of connecting to QDRANT_URL
+            search: Function searching the collection by vector, e.g. a batched search
+            router: Site router, loaded from the domain centroids collection by default
+            routing: Scope searches to the sites a query is about
+            collection_name: Qdrant collection to search
+            k: Number of chunks retrieved per query
+            min_route_score: Searches all sites instead when the best chunk of the
+                routed sites has a lower similarity than this
+        """
         self.graph_builder = StateGraph(MessagesState, config_schema=ConfigSchema)
-        self.llm = init_chat_model("gpt-4o-mini", model_provider="openai")
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        self.vector_store = QdrantVectorStore.from_existing_collection(
-            embedding=self.embeddings,
-            collection_name="demo_collection",
-            url=os.environ.get("QDRANT_URL"),
-            api_key=os.environ.get("QDRANT_API_KEY"),
-        )
+        self.llm = llm or init_chat_model("gpt-4o-mini", model_provider="openai")
+        self.embeddings = embeddings or get_embeddings()
+        if client is None:
+            self.vector_store = QdrantVectorStore.from_existing_collection(
+                embedding=self.embeddings,
+                collection_name=collection_name,
+                url=os.environ.get("QDRANT_URL"),
+                api_key=os.environ.get("QDRANT_API_KEY"),
+            )
+        else:
+            self.vector_store = QdrantVectorStore(
+                client=client,
+                collection_name=collection_name,
+                embedding=self.embeddings,
+            )
+        self.k = k
+        self.min_route_score = min_route_score
+        self.search = search or self.search_by_vector
+        self.router = None
+        if routing:
+            self.router = router or SiteRouter.from_qdrant(self.vector_store.client)
 
         @tool(response_format="content_and_artifact")
         def retrieve(query: str):
             """Retrieve information related to a query."""
-            retrieved_docs = self.vector_store.similarity_search(query, k=2)
+            retrieved_docs = self.retrieve_documents(query)
             serialized = "\n\n".join(
                 (f"Source: {doc.metadata['source']}\n" f"Content: {doc.page_content}")
                 for doc in retrieved_docs
@@ -56,66 +125,77 @@ class RetrievalPipeline:
         # Step 1: Generate an AIMessage that may include a tool-call to be sent.
         def query_or_respond(state: MessagesState):
             """Generate tool call for retrieval or respond."""
-            llm_with_tools = self.llm.bind_tools([self.retrieve_tool])
-            response = llm_with_tools.invoke(state["messages"])
-            # MessagesState appends messages to state instead of overwriting
-            return {"messages": [response]}
+            with span("graph_node", node="query_or_respond"):
+                llm_with_tools = self.llm.bind_tools([self.retrieve_tool])
+                response = llm_with_tools.invoke(state["messages"])
+                record_token_usage(response, "query_or_respond")
+                # MessagesState appends messages to state instead of overwriting
+                return {"messages": [response]}
 
         self.query_or_respond = query_or_respond
 
         # Step 2: Execute the retrieval.
-        self.tools = ToolNode([self.retrieve_tool])
+        tool_node = ToolNode([self.retrieve_tool])
+
+        def tools(state: MessagesState, config: RunnableConfig):
+            """Run the retrieval tool calls."""
+            with span("graph_node", node="tools"):
+                return tool_node.invoke(state, config)
+
+        self.tools = tools
 
         # Step 3: Generate a response using the retrieved content.
         def generate(state: MessagesState):
             """Generate answer."""
-            # Get generated ToolMessages
-            recent_tool_messages = []
-            for message in reversed(state["messages"]):
-                if message.type == "tool":
-                    recent_tool_messages.append(message)
-                else:
-                    break
-            tool_messages = recent_tool_messages[::-1]
-
-            # Format into prompt
-            docs_content = "\n\n".join(doc.content for doc in tool_messages)
-
-            # find the links in the content located in "Source: {doc.metadata['source']}\n"
-            links = re.findall(r"(?<=Source: ).*?(?=\n)", docs_content)
-            links = list(set(links))
-
-            # remove the "Source: {doc.metadata['source']}\n" from the content
-            docs_content = re.sub(r"Source: .*?\n", "", docs_content)
-
-            system_message_content = (
-                "You are GovSeek, an assistant for question-answering tasks."
-                "Use the following pieces of retrieved context to answer "
-                "the question. The context were retrieved from the links found in https://www.gov.sg/trusted-sites. "
-                "If you don't know the answer, say that you "
-                "don't know."
-                "\n\n"
-                f"{docs_content}"
-            )
-            conversation_messages = [
-                message
-                for message in state["messages"]
-                if message.type in ("human", "system")
-                or (message.type == "ai" and not message.tool_calls)
-            ]
-            prompt = [SystemMessage(system_message_content)] + conversation_messages
-
-            # Run
-            response = self.llm.invoke(prompt)
-
-            # Create a new AIMessage with the updated content
-            response_with_sources = AIMessage(
-                content=response.content, additional_kwargs={"sources": links}
-            )
+            with span("graph_node", node="generate"):
+                # Get generated ToolMessages
+                recent_tool_messages = []
+                for message in reversed(state["messages"]):
+                    if message.type == "tool":
+                        recent_tool_messages.append(message)
+                    else:
+                        break
+                tool_messages = recent_tool_messages[::-1]
+
+                # Format into prompt
+                docs_content = "\n\n".join(doc.content for doc in tool_messages)
+
+                # find the links in the content located in "Source: {doc.metadata['source']}\n"
+                links = re.findall(r"(?<=Source: ).*?(?=\n)", docs_content)
+                links = list(set(links))
+
+                # remove the "Source: {doc.metadata['source']}\n" from the content
+                docs_content = re.sub(r"Source: .*?\n", "", docs_content)
+
+                system_message_content = (
+                    "You are GovSeek, an assistant for question-answering tasks."
+                    "Use the following pieces of retrieved context to answer "
+                    "the question. The context were retrieved from the links found in https://www.gov.sg/trusted-sites. "
+                    "If you don't know the answer, say that you "
+                    "don't know."
+                    "\n\n"
+                    f"{docs_content}"
+                )
+                conversation_messages = [
+                    message
+                    for message in state["messages"]
+                    if message.type in ("human", "system")
+                    or (message.type == "ai" and not message.tool_calls)
+                ]
+                prompt = [SystemMessage(system_message_content)] + conversation_messages
+
+                # Run
+                response = self.llm.invoke(prompt)
+                record_token_usage(response, "generate")
 
-            return {
-                "messages": [response_with_sources],
-            }
+                # Create a new AIMessage with the updated content
+                response_with_sources = AIMessage(
+                    content=response.content, additional_kwargs={"sources": links}
+                )
+
+                return {
+                    "messages": [response_with_sources],
+                }
 
         self.generate = generate
 
@@ -135,6 +215,57 @@ class RetrievalPipeline:
         self.memory = MemorySaver()
         self.graph = self.graph_builder.compile(checkpointer=self.memory)
 
+    def retrieve_documents(self, query: str) -> List[Document]:
+        """Retrieve the chunks closest to a query.
+
+        Args:
+            query: Query text
+
+        Returns:
+            Up to k closest chunks
+        """
+        with span("query_embed"):
+            embedding = self.embeddings.embed_query(query)
+        domains = self.router.route(query, embedding) if self.router else []
+        if domains:
+            increment("query_routed")
+            with span("query_search", scope="domain"):
+                routed_docs = self.search(embedding, self.k, domain_filter(domains))
+            # a wrong route shows up as too few chunks, or chunks that are not
+            # close to the query, and only then are all sites searched
+            if (
+                len(routed_docs) >= self.k
+                and best_score(routed_docs) >= self.min_route_score
+            ):
+                return routed_docs
+            increment("query_route_fallback")
+
+        with span("query_search", scope="global"):
+            return self.search(embedding, self.k)
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: int,
+        query_filter: Optional[models.Filter] = None,
+    ) -> List[Document]:
+        """Search the collection for the documents closest to an embedding.
+
+        Args:
+            embedding: Query embedding
+            k: Number of documents to return
+            query_filter: Payload filter restricting the search
+
+        Returns:
+            Closest documents, with their similarity in the _score metadata
+        """
+        docs_and_scores = self.vector_store.similarity_search_with_score_by_vector(
+            embedding, k=k, filter=query_filter
+        )
+        for doc, score in docs_and_scores:
+            doc.metadata["_score"] = score
+        return [doc for doc, _ in docs_and_scores]
+
     def run(self, input_message: str, thread_id: str):
         """Run the retrieval pipeline with optional thread_id for continued conversations."""
         # Use provided thread_id or generate a new one
@@ -142,19 +273,59 @@ class RetrievalPipeline:
 
         full_response = ""
         sources = []
-        for step in self.graph.stream(
-            {"messages": [{"role": "user", "content": input_message}]},
-            stream_mode="values",
-            config=config,
-        ):
-            if "messages" in step:
-                message = step["messages"][-1]
-                if hasattr(message, "content"):
+        with span("query_turn"):
+            for step in self.graph.stream(
+                {"messages": [{"role": "user", "content": input_message}]},
+                stream_mode="values",
+                config=config,
+            ):
+                if "messages" in step:
+                    message = step["messages"][-1]
+                    if hasattr(message, "content"):
+                        full_response = message.content
+                    if hasattr(message, "additional_kwargs"):
+                        sources = message.additional_kwargs.get("sources", [])
+
+        return full_response, sources
+
+    def stream(
+        self, input_message: str, thread_id: str
+    ) -> Iterator[Tuple[str, Union[str, List[str]]]]:
+        """Run the retrieval pipeline, yielding the answer as it is generated.
+
+        Args:
+            input_message: Message from the user
+            thread_id: Conversation thread
+
+        Yields:
+            ("token", text) for each piece of the answer, then ("sources", links)
+        """
+        config = {"configurable": {"thread_id": thread_id}}
+
+        streamed = False
+        full_response = ""
+        sources = []
+        with span("query_turn"):
+            for mode, chunk in self.graph.stream(
+                {"messages": [{"role": "user", "content": input_message}]},
+                stream_mode=["messages", "values"],
+                config=config,
+            ):
+                if mode == "messages":
+                    message, _ = chunk
+                    # only token chunks from the chat model, not the final messages
+                    if isinstance(message, AIMessageChunk) and message.content:
+                        streamed = True
+                        yield "token", message.content
+                elif "messages" in chunk:
+                    message = chunk["messages"][-1]
                     full_response = message.content
-                if hasattr(message, "additional_kwargs"):
                     sources = message.additional_kwargs.get("sources", [])
 
-        return full_response, sources
+        # models that do not stream only produce the final message
+        if not streamed and full_response:
+            yield "token", full_response
+        yield "sources", sources
 
     def get_conversation_history(self, thread_id: str):
         """Retrieve previous conversation by thread_id."""
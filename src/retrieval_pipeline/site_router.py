@@ -0,0 +1,216 @@
+"""Route queries to the trusted sites they are likely about.
+
+Each chunk in the collection stores the domain of its site, and the mean embedding
+of every site is kept in a small `domain_centroids` collection. The router loads the
+centroids once and maps a query to domains locally, either because the query names
+a site (e.g. "IRAS" or "CPF") and is close to its centroid, or because its embedding
+is close to a site's centroid. The retriever then searches only those sites.
+"""
+
+import re
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+from loguru import logger
+from qdrant_client import QdrantClient, models
+
+CENTROIDS_COLLECTION = "domain_centroids"
+DOMAIN_PAYLOAD_KEY = "metadata.domain"
+
+# Host labels that do not identify a site
+GENERIC_LABELS = {"www", "gov", "sg", "com", "org", "net", "edu", "go"}
+
+
+def get_domain(link: str) -> str:
+    """Extract the domain of a link, without the www. prefix.
+
+    Args:
+        link: URL of a page
+
+    Returns:
+        Domain of the page
+    """
+    host = (urlparse(link).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def domain_filter(domains: Sequence[str]) -> models.Filter:
+    """Build a Qdrant filter matching chunks from any of the domains.
+
+    Args:
+        domains: Domains to search
+
+    Returns:
+        Qdrant payload filter
+    """
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key=DOMAIN_PAYLOAD_KEY, match=models.MatchAny(any=list(domains))
+            )
+        ]
+    )
+
+
+def compute_domain_centroids(
+    domains: Sequence[str], embeddings: np.ndarray
+) -> Tuple[List[str], np.ndarray]:
+    """Compute the normalised mean embedding of every domain.
+
+    Args:
+        domains: Domain of every embedding
+        embeddings: 2D array of normalised embeddings
+
+    Returns:
+        Sorted unique domains and a 2D array with their centroids
+    """
+    domains = np.asarray(domains)
+    unique_domains = sorted(set(domains.tolist()))
+    centroids = np.stack(
+        [embeddings[domains == domain].mean(axis=0) for domain in unique_domains]
+    ).astype(np.float32)
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    return unique_domains, centroids / np.where(norms == 0, 1.0, norms)
+
+
+def upsert_domain_centroids(
+    client: QdrantClient, domains: Sequence[str], embeddings: np.ndarray
+) -> None:
+    """Store the mean embedding of every domain in the centroids collection.
+
+    Args:
+        client: Qdrant client
+        domains: Domain of every embedding
+        embeddings: 2D array of normalised embeddings
+    """
+    unique_domains, centroids = compute_domain_centroids(domains, embeddings)
+
+    if client.collection_exists(CENTROIDS_COLLECTION):
+        client.delete_collection(CENTROIDS_COLLECTION)
+    client.create_collection(
+        collection_name=CENTROIDS_COLLECTION,
+        vectors_config=models.VectorParams(
+            size=embeddings.shape[1], distance=models.Distance.COSINE
+        ),
+    )
+
+    points = [
+        models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, domain)),
+            vector=centroid.tolist(),
+            payload={"domain": domain},
+        )
+        for domain, centroid in zip(unique_domains, centroids)
+    ]
+    client.upsert(collection_name=CENTROIDS_COLLECTION, points=points)
+    logger.info(f"Stored centroids of {len(points)} domains")
+
+
+class SiteRouter:
+    """Map a query to the domains it is likely about, using keywords or centroids."""
+
+    def __init__(
+        self,
+        domains: List[str],
+        centroids: np.ndarray,
+        max_domains: int = 3,
+        min_similarity: float = 0.25,
+        margin: float = 0.05,
+        keyword_margin: float = 0.1,
+    ):
+        """Initialize the router.
+
+        Args:
+            domains: Domains that can be routed to
+            centroids: 2D array with the normalised mean embedding of every domain
+            max_domains: Maximum number of domains a query is routed to
+            min_similarity: Minimum similarity of the best centroid to route at all
+            margin: Routes to every centroid within this similarity of the best one
+            keyword_margin: A site named in the query is only routed to when its
+                centroid is within this similarity of the best one
+        """
+        self.domains = domains
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.max_domains = max_domains
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.keyword_margin = keyword_margin
+        self.domain_index = {domain: i for i, domain in enumerate(domains)}
+
+        # keywords are the labels that identify a site, e.g. "iras" for iras.gov.sg
+        self.keywords: Dict[str, List[str]] = {}
+        for domain in domains:
+            for label in re.split(r"[.\-]", domain):
+                if label and label not in GENERIC_LABELS:
+                    self.keywords.setdefault(label, []).append(domain)
+
+    @classmethod
+    def from_qdrant(cls, client: QdrantClient, **kwargs) -> Optional["SiteRouter"]:
+        """Load the router from the centroids collection.
+
+        Args:
+            client: Qdrant client
+            kwargs: Arguments passed to SiteRouter
+
+        Returns:
+            Router, or None if the centroids collection does not exist
+        """
+        if not client.collection_exists(CENTROIDS_COLLECTION):
+            logger.info("No domain centroids found, searching all sites")
+            return None
+
+        points, offset = [], None
+        while True:
+            batch, offset = client.scroll(
+                collection_name=CENTROIDS_COLLECTION,
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            points.extend(batch)
+            if offset is None:
+                break
+
+        if not points:
+            return None
+        logger.info(f"Loaded centroids of {len(points)} domains for routing")
+        return cls(
+            domains=[point.payload["domain"] for point in points],
+            centroids=np.array([point.vector for point in points]),
+            **kwargs,
+        )
+
+    def route(self, query: str, embedding: Sequence[float]) -> List[str]:
+        """Find the domains a query is likely about.
+
+        Args:
+            query: Query text
+            embedding: Query embedding
+
+        Returns:
+            Domains to search, empty if the query should search all sites
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        similarities = self.centroids @ vector
+        order = np.argsort(-similarities)[: self.max_domains]
+        best = similarities[order[0]]
+
+        # words like "data" or "life" can match a site name by accident, so a named
+        # site also has to be about as close to the query as the best centroid
+        keyword_floor = max(self.min_similarity, best - self.keyword_margin)
+        matches = []
+        for word in re.findall(r"[a-z0-9]+", query.lower()):
+            for domain in self.keywords.get(word, []):
+                similarity = similarities[self.domain_index[domain]]
+                if domain not in matches and similarity >= keyword_floor:
+                    matches.append(domain)
+        if matches:
+            return matches[: self.max_domains]
+
+        if best < self.min_similarity:
+            return []
+        return [self.domains[i] for i in order if similarities[i] >= best - self.margin]
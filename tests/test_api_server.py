@@ -0,0 +1,93 @@
+"""Tests for the API server with fake models."""
+
+import asyncio
+
+import httpx
+import pytest
+from starlette.requests import ClientDisconnect
+
+from api_server import build_pipeline, create_app
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    """Pipeline with instant fake models and a small in-memory corpus."""
+    return build_pipeline(
+        fake=True,
+        batching=False,
+        fake_embedding_latency_ms=0,
+        fake_llm_latency_ms=0,
+        fake_embedding_concurrency=None,
+        fake_corpus_size=20,
+    )
+
+
+async def post(app, path, body):
+    """Send a POST request to the app."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json=body)
+
+
+async def disconnected_stream(app):
+    """Request a stream from a client that is gone before the response starts."""
+    body = b'{"message": "How do I renew my passport?"}'
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client disconnected")
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat/stream",
+        "raw_path": b"/chat/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    # newer Starlette versions re-raise the failed send as ClientDisconnect
+    with pytest.raises((OSError, ClientDisconnect)):
+        await app(scope, receive, send)
+
+
+def test_disconnected_stream_frees_its_slot(pipeline):
+    """A stream aborted before it starts does not keep its concurrency slot."""
+    app = create_app(pipeline, max_concurrency=1, max_queue=0)
+
+    async def scenario():
+        await disconnected_stream(app)
+        return await post(app, "/chat", {"message": "How do I renew my passport?"})
+
+    assert asyncio.run(scenario()).status_code == 200
+
+
+def test_turns_without_thread_id_keep_no_history(pipeline):
+    """Only threads named by the client are kept in the checkpointer."""
+    app = create_app(pipeline, max_threads=1)
+
+    async def scenario():
+        await post(app, "/chat", {"message": "What is CPF?"})
+        await post(app, "/chat", {"message": "What is CPF?", "thread_id": "a"})
+        await post(app, "/chat", {"message": "What is CPF?", "thread_id": "b"})
+
+    asyncio.run(scenario())
+    assert set(pipeline.memory.storage) == {"b"}
+
+
+@pytest.mark.parametrize("thread_id", [123, ["a"], {"id": "a"}])
+def test_non_string_thread_id_is_rejected(pipeline, thread_id):
+    """A thread id that is not a string is a client error, not a server error."""
+    app = create_app(pipeline)
+    response = asyncio.run(
+        post(app, "/chat", {"message": "What is CPF?", "thread_id": thread_id})
+    )
+    assert response.status_code == 400
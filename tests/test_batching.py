@@ -0,0 +1,50 @@
+"""Tests for micro-batching of concurrent calls."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from retrieval_pipeline.batching import MicroBatcher
+
+
+def test_submit_returns_the_result_of_each_item():
+    """Concurrent items are batched and each caller gets its own result."""
+    batches = []
+
+    def double(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, name="test", max_wait_ms=20)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher.submit, range(8)))
+    batcher.close()
+
+    assert results == [item * 2 for item in range(8)]
+    assert sum(len(batch) for batch in batches) == 8
+    assert max(len(batch) for batch in batches) > 1
+
+
+def test_short_result_fails_every_item():
+    """A process returning fewer results than items fails instead of hanging."""
+    batcher = MicroBatcher(lambda items: items[:-1], name="test", max_wait_ms=20)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(batcher.submit, item) for item in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+    batcher.close()
+
+
+def test_submit_times_out():
+    """Callers stop waiting for a batch that takes longer than the timeout."""
+
+    def slow(items):
+        time.sleep(0.5)
+        return items
+
+    batcher = MicroBatcher(slow, name="test", timeout=0.05)
+    with pytest.raises(TimeoutError):
+        batcher.submit(1)
+    batcher.close()
@@ -0,0 +1,135 @@
+"""Tests for URL handling and the crawl frontier of the WebScraper."""
+
+from types import SimpleNamespace
+
+import bs4
+import pytest
+
+from data_pipeline.crawler import WebScraper
+
+
+@pytest.fixture
+def scraper(tmp_path):
+    """WebScraper for a directory-style site that writes to a temporary file."""
+    scraper = WebScraper(
+        "https://www.iras.gov.sg/taxes/", "iras.gov.sg", min_delay=0, max_delay=0
+    )
+    scraper.json_filepath = str(tmp_path / "scraped.json")
+    return scraper
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("HTTPS://WWW.IRAS.gov.sg:443/taxes/", "https://www.iras.gov.sg/taxes"),
+        ("https://www.iras.gov.sg", "https://www.iras.gov.sg/"),
+        ("https://www.iras.gov.sg//a//b#section", "https://www.iras.gov.sg/a/b"),
+        (
+            "https://www.iras.gov.sg/search?q=gst&utm_source=x&a=1",
+            "https://www.iras.gov.sg/search?a=1&q=gst",
+        ),
+        ("http://www.iras.gov.sg:8080/", "http://www.iras.gov.sg:8080/"),
+    ],
+)
+def test_canonicalize_url(url, expected):
+    """Equivalent URLs map to the same canonical form."""
+    assert WebScraper.canonicalize_url(url) == expected
+
+
+def test_extract_links_resolves_against_directory_url():
+    """Relative links keep the directory of a URL with a trailing slash."""
+    soup = bs4.BeautifulSoup(
+        '<a href="individual-income-tax">a</a><a href="../about">b</a>'
+        '<a href="/contact">c</a>',
+        "html.parser",
+    )
+    assert WebScraper.extract_links(soup, "https://www.iras.gov.sg/taxes/") == [
+        "https://www.iras.gov.sg/taxes/individual-income-tax",
+        "https://www.iras.gov.sg/about",
+        "https://www.iras.gov.sg/contact",
+    ]
+
+
+def test_extract_links_uses_base_href():
+    """Relative links resolve against the page's <base href>."""
+    soup = bs4.BeautifulSoup(
+        '<base href="https://www.iras.gov.sg/taxes/"><a href="gst">a</a>',
+        "html.parser",
+    )
+    assert WebScraper.extract_links(soup, "https://www.iras.gov.sg/") == [
+        "https://www.iras.gov.sg/taxes/gst"
+    ]
+
+
+def fake_response(url, html):
+    """Build the parts of a requests.Response the scraper reads."""
+    return SimpleNamespace(
+        url=url, text=html, headers={"Content-Type": "text/html; charset=utf-8"}
+    )
+
+
+def test_scrape_counts_only_saved_pages(scraper, monkeypatch):
+    """Failed pages do not use up the page limit and sitemap pages are scraped."""
+    pages = {
+        "https://www.iras.gov.sg/taxes/": fake_response(
+            "https://www.iras.gov.sg/taxes/",
+            '<p>Taxes</p><a href="missing">Missing</a><a href="gst">GST</a>',
+        ),
+        "https://www.iras.gov.sg/taxes/gst": fake_response(
+            "https://www.iras.gov.sg/taxes/gst", "<p>GST</p>"
+        ),
+        "https://www.iras.gov.sg/sitemap-page": fake_response(
+            "https://www.iras.gov.sg/sitemap-page", "<p>From the sitemap</p>"
+        ),
+    }
+    monkeypatch.setattr(scraper, "fetch_url", pages.get)
+    monkeypatch.setattr(scraper, "load_robots_txt", lambda: [])
+    monkeypatch.setattr(
+        scraper,
+        "discover_sitemap_links",
+        lambda sitemap_urls: ["https://www.iras.gov.sg/sitemap-page"],
+    )
+    scraper.max_pages = 3
+
+    scraper.scrape()
+
+    assert scraper.visited_links == {
+        "https://www.iras.gov.sg/taxes",
+        "https://www.iras.gov.sg/taxes/gst",
+        "https://www.iras.gov.sg/sitemap-page",
+    }
+    assert "https://www.iras.gov.sg/taxes/missing" in scraper.seen_links
+
+
+def test_scrape_page_checks_redirect_target(scraper, monkeypatch):
+    """Pages redirected off the allowed domain are neither saved nor followed."""
+    monkeypatch.setattr(
+        scraper,
+        "fetch_url",
+        lambda url: fake_response(
+            "https://evil.example.com/landing", '<p>Elsewhere</p><a href="/x">x</a>'
+        ),
+    )
+
+    scraper.scrape_page("https://www.iras.gov.sg/taxes/out", depth=0)
+
+    assert scraper.visited_links == set()
+    assert not scraper.frontier
+
+
+def test_scrape_page_saves_the_served_url(scraper, monkeypatch):
+    """The saved link is the URL the page was served from, not its canonical key."""
+    monkeypatch.setattr(
+        scraper,
+        "fetch_url",
+        lambda url: fake_response(
+            "https://www.iras.gov.sg/Taxes/GST?utm_source=x", "<p>GST</p>"
+        ),
+    )
+    saved = []
+    monkeypatch.setattr(scraper, "save_content", lambda link, text: saved.append(link))
+
+    scraper.scrape_page("https://www.iras.gov.sg/taxes/gst", depth=0)
+
+    assert saved == ["https://www.iras.gov.sg/Taxes/GST?utm_source=x"]
+    assert scraper.visited_links == {"https://www.iras.gov.sg/Taxes/GST"}
@@ -0,0 +1,112 @@
+"""Tests for the reduced-dimension and half-precision embedding storage mode."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from qdrant_client import QdrantClient
+
+from data_pipeline.combine_embeddings import combine_embeddings
+from data_pipeline.embedding_storage import (
+    full_dimension_neighbours,
+    matryoshka_recall,
+    reduce_embeddings,
+)
+from data_pipeline.vector_store import VectorStore
+from retrieval_pipeline.fake_models import FakeEmbeddings
+
+
+@pytest.fixture
+def embeddings():
+    """Random full-dimension embeddings."""
+    return np.random.default_rng(0).standard_normal((300, 1536)).astype(np.float32)
+
+
+def test_reduce_embeddings_truncates_and_normalises(embeddings):
+    """Reduced vectors keep the leading dimensions and have unit length."""
+    reduced = reduce_embeddings(embeddings, 256)
+    assert reduced.shape == (300, 256)
+    assert reduced.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+    direction = embeddings[0, :256] / np.linalg.norm(embeddings[0, :256])
+    np.testing.assert_allclose(reduced[0], direction, rtol=1e-5)
+
+
+def test_reduce_embeddings_handles_single_and_zero_vectors():
+    """A single vector is reduced on its own and zero vectors stay zero."""
+    assert reduce_embeddings([3.0, 4.0, 12.0], 2).tolist() == pytest.approx([0.6, 0.8])
+    assert reduce_embeddings([[0.0, 0.0, 1.0]], 2).tolist() == [[0.0, 0.0]]
+
+
+def test_matryoshka_recall_of_full_vectors_is_perfect(embeddings):
+    """Keeping every dimension at full precision loses no neighbours."""
+    assert matryoshka_recall(embeddings, 1536) == 1.0
+
+
+def test_matryoshka_recall_drops_with_fewer_dimensions(embeddings):
+    """Random vectors share few neighbours once most dimensions are dropped."""
+    assert matryoshka_recall(embeddings, 64, dtype="float16") < 0.5
+
+
+def test_matryoshka_recall_reuses_full_dimension_neighbours(embeddings):
+    """Precomputed full-dimension neighbours give the same recall."""
+    expected = full_dimension_neighbours(embeddings, k=10)
+    assert matryoshka_recall(
+        embeddings, 256, dtype="float16", expected=expected
+    ) == matryoshka_recall(embeddings, 256, dtype="float16")
+
+
+def test_float16_parquet_round_trip(embeddings, tmp_path):
+    """Combined float16 embeddings are stored and read back as half floats."""
+    scraped_dir = tmp_path / "scraped_data"
+    output_dir = tmp_path / "generated_embeddings"
+    scraped_dir.mkdir()
+    output_dir.mkdir()
+    uuids = [f"uuid-{i}" for i in range(5)]
+    pd.DataFrame(
+        {"uuid": uuids, "link": ["https://www.iras.gov.sg/"] * 5, "text": ["t"] * 5}
+    ).to_json(scraped_dir / "iras.json", orient="records")
+    pd.DataFrame(
+        {
+            "id": uuids,
+            "custom_id": uuids,
+            "response": [
+                {"body": {"data": [{"embedding": row.tolist()}]}}
+                for row in embeddings[:5]
+            ],
+            "error": [None] * 5,
+        }
+    ).to_json(output_dir / "batch_output.jsonl", orient="records", lines=True)
+
+    combined = combine_embeddings(
+        str(scraped_dir), str(output_dir), 512, "float16", report_recall=False
+    )
+    path = tmp_path / "combined_embeddings.parquet"
+    combined.to_parquet(path, engine="pyarrow")
+
+    stored = pd.read_parquet(path).set_index("uuid").loc[uuids, "embedding"]
+    assert stored.iloc[0].dtype == np.float16
+    np.testing.assert_allclose(
+        np.stack(stored.tolist()).astype(np.float32),
+        reduce_embeddings(embeddings[:5], 512),
+        atol=1e-3,
+    )
+
+
+def test_vector_store_rejects_narrower_parquet_embeddings(
+    embeddings, tmp_path, monkeypatch
+):
+    """Indexing 512 dims embeddings into a 768 dims collection fails clearly."""
+    monkeypatch.setenv("EMBEDDING_DIMENSIONS", "768")
+    path = tmp_path / "combined_embeddings.parquet"
+    pd.DataFrame(
+        {
+            "uuid": [f"00000000-0000-0000-0000-00000000000{i}" for i in range(3)],
+            "link": ["https://www.iras.gov.sg/"] * 3,
+            "text": ["text"] * 3,
+            "embedding": list(reduce_embeddings(embeddings[:3], 512)),
+        }
+    ).to_parquet(path, engine="pyarrow")
+
+    store = VectorStore(client=QdrantClient(":memory:"), embeddings=FakeEmbeddings(768))
+    with pytest.raises(ValueError, match="stores 512 dims"):
+        store.populate_vector_store_from_parquet(str(path))
@@ -0,0 +1,130 @@
+"""Tests for the timing spans, counters and exporters of the metrics registry."""
+
+import json
+
+import pytest
+from qdrant_client import QdrantClient
+
+from data_pipeline.vector_store import VectorStore
+from monitoring import metrics as metrics_module
+from monitoring.metrics import (
+    BUCKETS,
+    NULL_SPAN,
+    Metrics,
+    increment,
+    span,
+)
+from retrieval_pipeline.fake_models import FakeChatModel, FakeEmbeddings
+from retrieval_pipeline.retriever import RetrievalPipeline
+
+
+@pytest.fixture
+def use_metrics(monkeypatch):
+    """Install a registry as the process-wide one for the duration of a test."""
+
+    def install(metrics: Metrics) -> Metrics:
+        monkeypatch.setattr(metrics_module, "_metrics", metrics)
+        return metrics
+
+    return install
+
+
+def test_histogram_buckets_are_cumulative():
+    """A duration is counted in its bucket and every larger one."""
+    metrics = Metrics("prometheus", "unused.prom")
+    metrics.observe("crawl_fetch", 0.02, {})
+    metrics.observe("crawl_fetch", 0.2, {})
+
+    count, total, *buckets = metrics.histograms[("crawl_fetch", ())]
+    assert count == 2
+    assert total == pytest.approx(0.22)
+    assert buckets == [(bound >= 0.02) + (bound >= 0.2) for bound in BUCKETS]
+
+
+def test_render_prometheus():
+    """Histograms and counters are rendered in the Prometheus text format."""
+    metrics = Metrics("prometheus", "unused.prom")
+    metrics.observe("query_search", 0.003, {"scope": "global"})
+    metrics.add("llm_input_tokens", 12, {"node": "generate"})
+    metrics.add("llm_input_tokens", 30, {"node": "generate"})
+
+    lines = metrics.render_prometheus().splitlines()
+
+    assert "# TYPE govseek_query_search_seconds histogram" in lines
+    assert 'govseek_query_search_seconds_bucket{scope="global",le="0.001"} 0' in lines
+    assert 'govseek_query_search_seconds_bucket{scope="global",le="0.005"} 1' in lines
+    assert 'govseek_query_search_seconds_bucket{scope="global",le="+Inf"} 1' in lines
+    assert 'govseek_query_search_seconds_count{scope="global"} 1' in lines
+    assert "# TYPE govseek_llm_input_tokens_total counter" in lines
+    assert 'govseek_llm_input_tokens_total{node="generate"} 42' in lines
+
+
+def test_export_prometheus_file(tmp_path):
+    """export writes the rendered metrics to the configured file."""
+    path = tmp_path / "metrics.prom"
+    metrics = Metrics("prometheus", str(path))
+    metrics.add("crawl_pages", 1, {})
+
+    metrics.export()
+
+    assert path.read_text() == metrics.render_prometheus()
+
+
+def test_jsonl_writes_each_event_immediately(tmp_path, use_metrics):
+    """Every span and counter update is on disk before the process exits."""
+    path = tmp_path / "logs" / "metrics.jsonl"
+    use_metrics(Metrics("jsonl", str(path)))
+
+    with span("crawl_fetch", status="ok"):
+        pass
+    increment("crawl_pages")
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["type"], r["name"]) for r in records] == [
+        ("span", "crawl_fetch"),
+        ("counter", "crawl_pages"),
+    ]
+    assert records[0]["labels"] == {"status": "ok"}
+    assert records[1]["value"] == 1
+
+
+def test_disabled_metrics_are_a_no_op(tmp_path, use_metrics, monkeypatch):
+    """Without an exporter nothing is recorded or written."""
+    monkeypatch.chdir(tmp_path)
+    metrics = use_metrics(Metrics())
+
+    assert span("crawl_fetch") is NULL_SPAN
+    with span("crawl_fetch"):
+        pass
+    increment("crawl_pages", 3)
+    metrics.export()
+
+    assert not metrics.histograms
+    assert not metrics.counters
+    assert not list(tmp_path.iterdir())
+
+
+def test_unknown_exporter_is_rejected():
+    """A misspelt METRICS_EXPORTER fails instead of silently disabling metrics."""
+    with pytest.raises(ValueError, match="METRICS_EXPORTER"):
+        Metrics("statsd")
+
+
+def test_every_graph_node_is_timed(use_metrics):
+    """A chat turn records a span for each node of the graph, including the tools."""
+    metrics = use_metrics(Metrics("prometheus", "unused.prom"))
+    client = QdrantClient(":memory:")
+    embeddings = FakeEmbeddings()
+    VectorStore(client=client, embeddings=embeddings)
+    pipeline = RetrievalPipeline(
+        llm=FakeChatModel(), embeddings=embeddings, client=client, routing=False
+    )
+
+    pipeline.run("How do I file my income tax?", "thread")
+
+    nodes = {
+        dict(labels)["node"]
+        for name, labels in metrics.histograms
+        if name == "graph_node"
+    }
+    assert nodes == {"query_or_respond", "tools", "generate"}
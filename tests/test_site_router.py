@@ -0,0 +1,91 @@
+"""Tests for routing queries to sites and the fallback to searching all sites."""
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+
+from data_pipeline.vector_store import VectorStore
+from retrieval_pipeline.fake_models import FakeChatModel, FakeEmbeddings
+from retrieval_pipeline.retriever import RetrievalPipeline
+from retrieval_pipeline.site_router import SiteRouter
+
+DOMAINS = ["iras.gov.sg", "data.gov.sg", "cpf.gov.sg"]
+
+
+@pytest.fixture
+def router():
+    """Router over three sites with orthogonal centroids."""
+    return SiteRouter(DOMAINS, np.eye(3, 8, dtype=np.float32))
+
+
+def test_keyword_routes_to_a_named_site(router):
+    """A site named in the query is searched when the query is about it."""
+    embedding = [0.2, 0.1, 0.9, 0, 0, 0, 0, 0]
+    assert router.route("How do I withdraw my CPF?", embedding) == ["cpf.gov.sg"]
+
+
+def test_keyword_far_from_the_query_is_ignored(router):
+    """A word that happens to match a site name does not decide the route."""
+    embedding = [0.9, 0.1, 0, 0, 0, 0, 0, 0]
+    assert router.route("Is my data safe when I file taxes?", embedding) == [
+        "iras.gov.sg"
+    ]
+
+
+def test_unrelated_query_searches_all_sites(router):
+    """Queries far from every centroid are not routed."""
+    embedding = [0, 0, 0, 1, 0, 0, 0, 0]
+    assert router.route("What is the weather today?", embedding) == []
+
+
+class StubRouter:
+    """Router that always routes to the same site."""
+
+    def route(self, query, embedding):
+        """Route every query to iras.gov.sg."""
+        return ["iras.gov.sg"]
+
+
+def make_pipeline(routed_scores, global_scores, searches):
+    """Pipeline whose routed and global searches return chunks with the scores."""
+
+    def search(embedding, k, query_filter=None):
+        """Return routed chunks for filtered searches and global ones otherwise."""
+        scope, scores = (
+            ("routed", routed_scores) if query_filter else ("global", global_scores)
+        )
+        searches.append(scope)
+        return [
+            Document(page_content=scope, metadata={"source": scope, "_score": score})
+            for score in scores
+        ]
+
+    client = QdrantClient(":memory:")
+    embeddings = FakeEmbeddings()
+    VectorStore(client=client, embeddings=embeddings)
+    return RetrievalPipeline(
+        llm=FakeChatModel(),
+        embeddings=embeddings,
+        client=client,
+        search=search,
+        router=StubRouter(),
+    )
+
+
+@pytest.mark.parametrize(
+    "routed_scores, global_scores, expected",
+    [
+        ([0.80, 0.78], [0.82, 0.80], "routed"),
+        ([0.20, 0.18], [0.82, 0.80], "global"),
+        ([0.80], [0.82, 0.80], "global"),
+    ],
+)
+def test_wrong_route_falls_back_to_all_sites(routed_scores, global_scores, expected):
+    """Routed chunks are used unless there are too few or they are not close."""
+    searches = []
+    pipeline = make_pipeline(routed_scores, global_scores, searches)
+    docs = pipeline.retrieve_documents("How do I file my taxes?")
+    assert {doc.page_content for doc in docs} == {expected}
+    # all sites are only searched when the routed search is not good enough
+    assert searches == (["routed"] if expected == "routed" else ["routed", "global"])